@@ -5,14 +5,17 @@ import requests
 import pandas as pd
 import json
 from datetime import datetime
-from meter import MeterManager
+from meter import MeterManager, StatusWatcher
 from user import UserManager
+from metrics import instrument, log_event
 
 app = Flask(__name__)
 app.secret_key = "secret_key"
+instrument(app, "app")
 
 user_manager = UserManager()
 meter_manager = MeterManager()
+status_watcher = StatusWatcher().start()   # store_readings status, kept current in the background
 
 # ——————————————————————————————————————————————
 
@@ -32,7 +35,7 @@ def login():
         session["username"] = username
         session["meter_id"] = user_manager.get_meter_id(username)
 
-        print("Current registered users:", user_manager.users) # test if users.dic works
+        log_event("login", username=username)
 
         return redirect(url_for("main"))
     return render_template("login.html")
@@ -54,7 +57,6 @@ def signup():
             return redirect(url_for("signup"))
         if user_manager.add_user(username, password):
             flash("Sign up successful!", "success")
-            user_manager.save_users()  # Save to JSON after adding
             return redirect(url_for("login"))
         else:
             flash("Username already exists!", "error")
@@ -69,18 +71,18 @@ def user_meter():
     response_data = {"meter_id": meter_id, "usage_kwh": usage_value}
     return render_template("user_meter.html", usage=usage_value)
 
-# 访问 user_usage.html 前先检查 acceptAPI 状态
+# 服务器状态来自 StatusWatcher（meter.py，长轮询 store_readings 并缓存在内存），无需每次请求单独查询 server_status
 @app.route("/user_usage", methods=["GET"])
 def user_usage():
 
-    response = requests.get("http://127.0.0.1:5002/api/server_status")
-    
-    if response.status_code == 200 and response.json().get("acceptAPI", False):
-        meter_id = session.get("meter_id")
-        usage_data = meter_manager.get_user_usage(meter_id)
-        return render_template("user_usage.html", **usage_data)
-    else:
+    if not status_watcher.accepting():
+        return redirect("/server_busy")
+    meter_id = session.get("meter_id")
+    usage_data = meter_manager.get_user_usage(meter_id)
+
+    if usage_data.get("busy"):
         return redirect("/server_busy")  # **如果 `acceptAPI = False`，跳转到 `server_busy.html`**
+    return render_template("user_usage.html", **usage_data)
 
 @app.route("/server_busy", methods=["GET"])
 def server_busy():
@@ -103,13 +105,14 @@ def supplier_result():
 
 @app.route("/administrator")
 def administrator():
-    pass
+    fleet = meter_manager.get_fleet_summary()
+    return render_template("administrator.html", **fleet)
 
 # ——————————————————————————————————————————
 
 @app.route("/meter_ids", methods=["GET"])
 def get_meter_ids():
-    meter_ids = [user["meter_id"] for user in user_manager.users.values()]
+    meter_ids = user_manager.get_meter_ids()
     return jsonify(meter_ids)
 
 # ——————————————————————————————————————————
@@ -0,0 +1,234 @@
+# v1
+import os
+import sys
+import json
+import time
+import random
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+import numpy as np
+import requests
+from datetime import datetime
+
+# End-to-end load test: starts app.py (5000), mock_meter.py (5001, simulation
+# mode) and store_readings.py (5002) in a scratch directory with a synthetic
+# fleet, drives user traffic plus half-hour ingest ticks, and prints JSON:
+#
+#   python benchmark.py --meters 10000 --users 1000 --duration 60 --output bench.json
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_URL = "http://127.0.0.1:5000"
+METER_URL = "http://127.0.0.1:5001"
+STORE_URL = "http://127.0.0.1:5002"
+FIRST_METER_ID = 100000001
+STARTUP_TIMEOUT = 300   # seconds per service; store_readings builds its test history first
+FETCH_TIMEOUT = 30 * 60   # one ingest tick may take up to the half-hour window
+
+# (endpoint, weight): a session mostly checks usage, sometimes the live meter,
+# and a supplier lookup now and then
+TRAFFIC_MIX = [("/user_usage", 6), ("/user_meter", 3), ("/supplier_result", 1)]
+
+
+def start_service(args, workdir, log_name, env=None):
+    log = open(os.path.join(workdir, log_name), "w")
+    # own process group, so the Flask reloader child is stopped too
+    return subprocess.Popen([sys.executable] + args, cwd=workdir, stdout=log, stderr=subprocess.STDOUT,
+                            env={**os.environ, **(env or {})}, start_new_session=True)
+
+
+def stop_service(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=10)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def wait_for(url, process, timeout=STARTUP_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"service for {url} exited with code {process.returncode}")
+        try:
+            if requests.get(url, timeout=2).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+# Users are written as users.json; app.py migrates them into users.db on start
+def create_users(workdir, n_users):
+    users = {f"bench{i}": {"password": f"pw{i}", "meter_id": str(FIRST_METER_ID + i)} for i in range(n_users)}
+    with open(os.path.join(workdir, "users.json"), "w") as f:
+        json.dump(users, f)
+    os.makedirs(os.path.join(workdir, "meter_data"), exist_ok=True)
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, duration):
+        with self.lock:
+            result = {}
+            for endpoint, latencies in sorted(self.latencies.items()):
+                ms = np.array(latencies) * 1000
+                result[endpoint] = {
+                    "requests": len(ms),
+                    "errors": self.errors.get(endpoint, 0),
+                    "throughput_rps": round(len(ms) / duration, 2),
+                    "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                    "p95_ms": round(float(np.percentile(ms, 95)), 3),
+                    "p99_ms": round(float(np.percentile(ms, 99)), 3),
+                    "max_ms": round(float(ms.max()), 3),
+                }
+            return result
+
+
+def timed(recorder, endpoint, call):
+    started = time.perf_counter()
+    try:
+        response = call()
+        ok = response.status_code < 400
+    except requests.RequestException:
+        ok = False
+    recorder.record(endpoint, time.perf_counter() - started, ok)
+
+
+# One virtual user: log in, then browse until the run ends
+def user_session(recorder, n_users, n_meters, stop_at, seed):
+    rng = random.Random(seed)
+    session = requests.Session()
+    user = rng.randrange(n_users)
+    timed(recorder, "/login", lambda: session.post(
+        f"{APP_URL}/login", data={"username": f"bench{user}", "password": f"pw{user}"}, timeout=30))
+
+    endpoints = [endpoint for endpoint, _ in TRAFFIC_MIX]
+    weights = [weight for _, weight in TRAFFIC_MIX]
+    while time.monotonic() < stop_at:
+        endpoint = rng.choices(endpoints, weights)[0]
+        if endpoint == "/supplier_result":
+            meter_id = str(FIRST_METER_ID + rng.randrange(n_meters))
+            timed(recorder, endpoint, lambda: session.post(
+                f"{APP_URL}/supplier_result", data={"meter_id": meter_id}, timeout=30))
+        else:
+            timed(recorder, endpoint, lambda: session.get(f"{APP_URL}{endpoint}", timeout=30))
+
+
+# Half-hour ingest ticks, compressed to one every tick_interval seconds:
+# a gateway push from mock_meter, or a pull by store_readings
+def ingest_ticks(ingest_mode, tick_interval, stop_at, cycles):
+    tick_url = f"{METER_URL}/push_now" if ingest_mode == "push" else f"{STORE_URL}/fetch_now"
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        try:
+            response = requests.post(tick_url, timeout=FETCH_TIMEOUT)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        cycles.append({"seconds": round(time.perf_counter() - started, 4), "ok": ok})
+        time.sleep(max(0, min(tick_interval - (time.perf_counter() - started), stop_at - time.monotonic())))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="electricity_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    create_users(workdir, args.users)
+
+    services = []
+    try:
+        started = time.perf_counter()
+        services.append(start_service([os.path.join(REPO_DIR, "app.py")], workdir, "app.log"))
+        wait_for(f"{APP_URL}/", services[-1])
+        meter_args = ["--simulate", "--meters", str(args.meters)]
+        meter_args += ["--no-push"] if args.ingest == "pull" else ["--batch-size", str(args.batch_size)]
+        services.append(start_service([os.path.join(REPO_DIR, "mock_meter.py")] + meter_args,
+                                      workdir, "mock_meter.log"))
+        wait_for(f"{METER_URL}/get_meter_data/{FIRST_METER_ID}", services[-1])
+        services.append(start_service([os.path.join(REPO_DIR, "store_readings.py")], workdir, "store_readings.log",
+                                      env={"INGEST_MODE": args.ingest}))
+        wait_for(f"{STORE_URL}/api/server_status", services[-1])
+        startup_seconds = time.perf_counter() - started
+        print(f"services up in {startup_seconds:.1f}s, logs in {workdir}", file=sys.stderr)
+
+        recorder = Recorder()
+        cycles = []
+        stop_at = time.monotonic() + args.duration
+        threads = [threading.Thread(target=ingest_ticks, args=(args.ingest, args.tick_interval, stop_at, cycles))]
+        threads += [threading.Thread(target=user_session, args=(recorder, args.users, args.meters, stop_at, seed))
+                    for seed in range(args.concurrency)]
+        run_started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - run_started
+    finally:
+        for process in reversed(services):
+            stop_service(process)
+
+    cycle_seconds = np.array([cycle["seconds"] for cycle in cycles if cycle["ok"]])
+    return {
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {"meters": args.meters, "users": args.users, "concurrency": args.concurrency,
+                   "duration": args.duration, "tick_interval": args.tick_interval, "ingest": args.ingest,
+                   "batch_size": args.batch_size if args.ingest == "push" else None},
+        "startup_seconds": round(startup_seconds, 3),
+        "duration_seconds": round(duration, 3),
+        "endpoints": recorder.summary(duration),
+        "ingest": {
+            "cycles": len(cycles),
+            "failed": sum(not cycle["ok"] for cycle in cycles),
+            "p50_seconds": round(float(np.percentile(cycle_seconds, 50)), 4) if len(cycle_seconds) else None,
+            "max_seconds": round(float(cycle_seconds.max()), 4) if len(cycle_seconds) else None,
+            "cycle_seconds": [cycle["seconds"] for cycle in cycles],
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="load test app.py + mock_meter.py + store_readings.py")
+    parser.add_argument("--meters", type=int, default=1000, help="synthetic fleet size (N)")
+    parser.add_argument("--users", type=int, default=200, help="registered users (M), M <= N")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users browsing at once")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of traffic")
+    parser.add_argument("--tick-interval", type=float, default=10, help="seconds between ingest ticks")
+    parser.add_argument("--ingest", choices=["push", "pull"], default="push",
+                        help="push: mock_meter POSTs batches to /ingest; pull: store_readings polls mock_meter")
+    parser.add_argument("--batch-size", type=int, default=5000, help="readings per push request")
+    parser.add_argument("--workdir", help="scratch directory for data files and logs (default: new temp dir)")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+    if args.users > args.meters:
+        parser.error("--users must not exceed --meters")
+
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
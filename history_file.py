@@ -0,0 +1,209 @@
+# v1
+import os
+import sys
+import mmap
+import struct
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from today_csv import parse_csv_block
+
+# Fixed-layout daily history file, opened with mmap.
+#
+#   header      64 bytes (HEADER_FORMAT)
+#   meter index meter_capacity x METER_ID_WIDTH bytes, ASCII, NUL padded
+#   readings    meter_capacity x day_capacity float64, one row per meter,
+#               one slot per calendar day from base_date, NaN when missing
+#
+# One meter's history for a date range is a contiguous slice of its row, and
+# archiving a day writes just that day's slot in each row.
+
+MAGIC = b"ELHIST01"
+VERSION = 1
+HEADER_FORMAT = "<8sIIIIII"          # magic, version, meter_capacity, n_meters, day_capacity, n_days, base_date
+HEADER_SIZE = 64
+METER_ID_WIDTH = 16
+INITIAL_METERS = 1024
+INITIAL_DAYS = 512
+
+
+def date_to_datetime(date):
+    return datetime.strptime(str(int(date)), "%Y%m%d")
+
+
+def day_offset(base_date, date):
+    return (date_to_datetime(date) - date_to_datetime(base_date)).days
+
+
+def offset_to_date(base_date, offset):
+    return int((date_to_datetime(base_date) + timedelta(days=int(offset))).strftime("%Y%m%d"))
+
+
+class HistoryFile:
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.writable = writable
+        self.file = open(path, "r+b" if writable else "rb")
+        self._map()
+
+    def _map(self):
+        access = mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=access)
+        (magic, version, self.meter_capacity, self.n_meters,
+         self.day_capacity, self.n_days, self.base_date) = struct.unpack_from(HEADER_FORMAT, self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a daily history file")
+
+        ids = np.frombuffer(self.mm, dtype=f"S{METER_ID_WIDTH}", count=self.n_meters, offset=HEADER_SIZE)
+        self.meter_ids = [meter_id.decode("ascii") for meter_id in ids]
+        self.rows = {meter_id: row for row, meter_id in enumerate(self.meter_ids)}
+
+        data_offset = HEADER_SIZE + self.meter_capacity * METER_ID_WIDTH
+        self.readings = np.frombuffer(self.mm, dtype=np.float64, count=self.meter_capacity * self.day_capacity,
+                                      offset=data_offset).reshape(self.meter_capacity, self.day_capacity)
+
+    @classmethod
+    def create(cls, path, base_date, meter_capacity=INITIAL_METERS, day_capacity=INITIAL_DAYS):
+        data_offset = HEADER_SIZE + meter_capacity * METER_ID_WIDTH
+        with open(path, "wb") as f:
+            header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, meter_capacity, 0, day_capacity, 0, int(base_date))
+            f.write(header.ljust(HEADER_SIZE, b"\0"))
+            f.write(b"\0" * (meter_capacity * METER_ID_WIDTH))
+            f.seek(data_offset)
+            np.full(meter_capacity * day_capacity, np.nan).tofile(f)
+        return cls(path, writable=True)
+
+    def close(self):
+        del self.readings
+        self.mm.close()
+        self.file.close()
+
+    def _write_header(self):
+        struct.pack_into(HEADER_FORMAT, self.mm, 0, MAGIC, VERSION, self.meter_capacity, self.n_meters,
+                         self.day_capacity, self.n_days, self.base_date)
+
+    # Rebuild into a bigger file (more meters, more days, or an earlier base date)
+    def _grow(self, meter_capacity, day_capacity, base_date):
+        shift = day_offset(base_date, self.base_date) if self.n_days else 0
+        tmp_path = self.path + ".tmp"
+        grown = HistoryFile.create(tmp_path, base_date, meter_capacity, day_capacity)
+        grown._add_meters(self.meter_ids)
+        grown.readings[:self.n_meters, shift:shift + self.n_days] = self.readings[:self.n_meters, :self.n_days]
+        grown.n_days = shift + self.n_days
+        grown._write_header()
+        grown.mm.flush()
+        grown.close()
+
+        self.close()
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, "r+b")
+        self._map()
+
+    def _add_meters(self, meter_ids):
+        new_ids = [meter_id for meter_id in dict.fromkeys(meter_ids) if meter_id not in self.rows]
+        if not new_ids:
+            return
+        if self.n_meters + len(new_ids) > self.meter_capacity:
+            capacity = self.meter_capacity
+            while capacity < self.n_meters + len(new_ids):
+                capacity *= 2
+            self._grow(capacity, self.day_capacity, self.base_date)
+
+        start = HEADER_SIZE + self.n_meters * METER_ID_WIDTH
+        encoded = np.array([meter_id.encode("ascii") for meter_id in new_ids], dtype=f"S{METER_ID_WIDTH}")
+        self.mm[start:start + encoded.nbytes] = encoded.tobytes()
+        for meter_id in new_ids:
+            self.rows[meter_id] = self.n_meters
+            self.meter_ids.append(meter_id)
+            self.n_meters += 1
+        self._write_header()
+
+    # Archive one day: only that day's slot of each meter is written
+    def write_day(self, date, meter_ids, values):
+        date = int(date)
+        if self.n_days == 0:
+            self.base_date = date
+        base_date = min(self.base_date, date)
+        offset = day_offset(base_date, date)
+        needed = max(offset + 1, day_offset(base_date, self.base_date) + self.n_days)
+        if base_date != self.base_date or needed > self.day_capacity:
+            day_capacity = self.day_capacity
+            while day_capacity < needed:
+                day_capacity *= 2
+            self._grow(self.meter_capacity, day_capacity, base_date)
+
+        self._add_meters(meter_ids)
+        rows = np.fromiter((self.rows[meter_id] for meter_id in meter_ids), dtype=np.int64, count=len(meter_ids))
+        self.readings[rows, offset] = values
+        self.n_days = max(self.n_days, offset + 1)
+        self._write_header()
+        self.mm.flush()
+
+    # One meter's readings for start..end (inclusive), read straight from the map
+    def read_range(self, meter_id, start, end):
+        row = self.rows.get(meter_id)
+        if row is None or self.n_days == 0:
+            return [], np.empty(0)
+        first = max(0, day_offset(self.base_date, start))
+        last = min(self.n_days - 1, day_offset(self.base_date, end))
+        if last < first:
+            return [], np.empty(0)
+        values = np.array(self.readings[row, first:last + 1])
+        dates = [offset_to_date(self.base_date, offset) for offset in range(first, last + 1)]
+        return dates, values
+
+    # (meter_ids, dates, meters x days matrix) for every day that has any reading
+    def to_arrays(self):
+        readings = self.readings[:self.n_meters, :self.n_days]
+        used = np.flatnonzero(~np.isnan(readings).all(axis=0))
+        dates = np.array([offset_to_date(self.base_date, offset) for offset in used], dtype=np.int64)
+        return list(self.meter_ids), dates, np.array(readings[:, used])
+
+    def export_csv(self, csv_path):
+        meter_ids, dates, readings = self.to_arrays()
+        df = pd.DataFrame(readings.T, columns=meter_ids)
+        df.insert(0, "date", dates)
+        df.to_csv(csv_path, index=False)
+
+    @classmethod
+    def from_csv(cls, csv_path, path):
+        with open(csv_path, "r", encoding="utf-8") as f:
+            columns, matrix = parse_csv_block(f.read().replace("-", ""))
+        meter_ids = columns[1:]
+        dates = matrix[:, 0].astype(np.int64)
+
+        base_date = int(dates.min()) if len(dates) else 0
+        span = day_offset(base_date, dates.max()) + 1 if len(dates) else 0
+        meter_capacity, day_capacity = INITIAL_METERS, INITIAL_DAYS
+        while meter_capacity < len(meter_ids):
+            meter_capacity *= 2
+        while day_capacity < span:
+            day_capacity *= 2
+
+        history = cls.create(path, base_date, meter_capacity, day_capacity)
+        history._add_meters(meter_ids)
+        offsets = [day_offset(base_date, date) for date in dates]
+        history.readings[:len(meter_ids), offsets] = matrix[:, 1:].T
+        history.n_days = span
+        history._write_header()
+        history.mm.flush()
+        return history
+
+
+# CSV compatibility tool:
+#   python history_file.py export electricity_data_daily.bin electricity_data_daily.csv
+#   python history_file.py import electricity_data_daily.csv electricity_data_daily.bin
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("export", "import"):
+        print("usage: python history_file.py export|import <source> <target>")
+        sys.exit(1)
+
+    command, source, target = sys.argv[1:]
+    if command == "export":
+        history = HistoryFile(source)
+        history.export_csv(target)
+    else:
+        history = HistoryFile.from_csv(source, target)
+    print(f"{command}: {history.n_meters} meters x {history.n_days} days, {source} -> {target}")
+    history.close()
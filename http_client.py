@@ -0,0 +1,72 @@
+# v1
+import time
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from metrics import metrics
+
+# Shared HTTP client for calls between app.py, mock_meter.py and store_readings.py.
+# One keep-alive session per process: connections to each host are pooled and
+# reused, every call has a timeout, and failed calls are retried with backoff.
+
+DEFAULT_TIMEOUT = (3, 10)      # seconds: (connect, read)
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.2          # seconds, doubled on each retry
+DEFAULT_POOL_SIZE = 16         # kept-alive connections per host
+RETRY_STATUSES = (502, 504)    # 503 means "busy" in store_readings and is not retried
+
+
+class HttpClient:
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 pool_size=DEFAULT_POOL_SIZE):
+        self.timeout = timeout
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset({"GET", "POST"}), raise_on_status=False)
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self._record(url, time.perf_counter() - started, failed=True)
+            raise
+        self._record(url, time.perf_counter() - started, failed=response.status_code >= 500)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    # request count and latency per host are the upstream_request_seconds histogram
+    def _record(self, url, elapsed, failed):
+        host = urlsplit(url).netloc
+        metrics.observe("upstream_request_seconds", elapsed, host=host)
+        if failed:
+            metrics.inc("upstream_errors_total", host=host)
+
+    # TCP connections opened per host; with keep-alive this stays near the pool size
+    def connections_opened(self):
+        pools = self.adapter.poolmanager.pools
+        opened = {}
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                host = f"{pool.host}:{pool.port}" if pool.port else pool.host
+                opened[host] = opened.get(host, 0) + pool.num_connections
+        return opened
+
+    def export_metrics(self, registry):
+        for host, opened in self.connections_opened().items():
+            registry.set("upstream_connections_opened", opened, host=host)
+
+
+client = HttpClient()
+metrics.add_collector(client.export_metrics)
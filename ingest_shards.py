@@ -0,0 +1,81 @@
+# v1
+import time
+import zlib
+import requests
+import numpy as np
+from http_client import HttpClient
+from metrics import configure_logging, log_event
+
+# Sharded ingestion for store_readings.py.
+#
+# The meter ID space is partitioned across a process pool. Each shard fetches
+# and parses its own partition in its own process and hands back plain arrays;
+# store_readings merges them into the central store once per half-hour tick.
+
+shard_client = None   # one HTTP client per worker process, never shared across fork
+
+
+def init_shard_worker():
+    global shard_client
+    shard_client = HttpClient()
+    configure_logging()
+
+
+def shard_of(meter_id, n_shards):
+    try:
+        return int(meter_id) % n_shards
+    except ValueError:
+        return zlib.crc32(str(meter_id).encode("utf-8")) % n_shards
+
+
+def partition(meter_ids, n_shards):
+    shards = [[] for _ in range(n_shards)]
+    for meter_id in meter_ids:
+        shards[shard_of(meter_id, n_shards)].append(meter_id)
+    return shards
+
+
+# Runs in a worker process. deadline is wall-clock time (time.time()).
+def fetch_shard(shard, url, meter_ids, chunk_size, deadline):
+    started = time.time()
+    fetch_seconds = 0.0
+    parse_seconds = 0.0
+    received_ids = []
+    received_values = []
+    chunks = [meter_ids[i:i + chunk_size] for i in range(0, len(meter_ids), chunk_size)]
+    failed_chunks = 0
+
+    for n, chunk in enumerate(chunks):
+        timeout = deadline - time.time()
+        if timeout <= 0:
+            failed_chunks += len(chunks) - n   # out of budget: skip the rest of the partition
+            break
+        request_started = time.time()
+        try:
+            response = shard_client.post(url, json={"meter_ids": chunk}, timeout=max(1, timeout))
+            response.raise_for_status()
+            fetched = time.time()
+            readings = response.json().get("readings", {})
+        except (requests.RequestException, ValueError) as e:
+            failed_chunks += 1
+            log_event("bulk_read_failed", shard=shard, error=str(e))
+            continue
+        fetch_seconds += fetched - request_started
+
+        for meter_id, reading in readings.items():
+            if reading is not None:
+                received_ids.append(meter_id)
+                received_values.append(reading)
+        parse_seconds += time.time() - fetched
+
+    return {
+        "shard": shard,
+        "meter_ids": received_ids,
+        "values": np.array(received_values, dtype=np.float64),
+        "requested": len(meter_ids),
+        "chunks": len(chunks),
+        "failed_chunks": failed_chunks,
+        "fetch_seconds": fetch_seconds,
+        "parse_seconds": parse_seconds,
+        "total_seconds": time.time() - started,
+    }
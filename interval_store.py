@@ -0,0 +1,184 @@
+# v1
+import os
+import json
+import struct
+import threading
+from collections import OrderedDict
+import numpy as np
+from codec import encode_block, decode_block, SCALE
+
+# Half-hourly interval history, one partition file per day.
+#
+#   interval_data/intervals_YYYYMMDD.elzd   one day, written once at rollover
+#   interval_data/manifest.json             day -> file, meters, size, fleet figures
+#
+# A partition holds, per meter, the opening reading and the 48 slot readings,
+# encoded with codec.py in blocks of GROUP_METERS meters. Partitions are read
+# only when a query touches their day and kept (still compressed) in an LRU
+# cache bounded by CACHE_BYTES; a query decodes just its meter's block, so
+# memory stays flat however many months are on disk.
+
+INTERVAL_FOLDER = "interval_data"
+MANIFEST = "manifest.json"
+GROUP_METERS = 4096
+CACHE_BYTES = 256 << 20
+MAGIC = b"ELZDAY01"
+HEADER_FORMAT = "<8sI"     # magic, meta length
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+
+# kWh used in each slot: reading minus the previous reading that day (or the opening one)
+def slot_usage(opening, readings):
+    series = np.concatenate([[opening], readings])
+    filled = ~np.isnan(series)
+    last_seen = np.maximum.accumulate(np.where(filled, np.arange(len(series)), 0))
+    previous = series[last_seen[:-1]]
+    usage = readings - previous
+    usage[np.isnan(readings)] = np.nan
+    return np.clip(usage, 0, None)
+
+
+class IntervalPartition:
+    def __init__(self, date, meter_ids, blocks, data, scale, group_meters):
+        self.date = date
+        self.meter_ids = meter_ids
+        self.rows = {meter_id: row for row, meter_id in enumerate(meter_ids)}
+        self.blocks = blocks
+        self.data = data
+        self.scale = scale
+        self.group_meters = group_meters
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    @classmethod
+    def write(cls, path, date, meter_ids, opening, readings, scale=SCALE, group_meters=GROUP_METERS):
+        matrix = np.hstack([np.asarray(opening, dtype=np.float64)[:, None], readings])
+        encoded = [encode_block(matrix[start:start + group_meters], scale)
+                   for start in range(0, len(meter_ids), group_meters)]
+        blocks = []
+        offset = 0
+        for data in encoded:
+            blocks.append([offset, len(data)])
+            offset += len(data)
+        meta = json.dumps({"date": int(date), "scale": scale, "group_meters": group_meters,
+                           "meter_ids": list(meter_ids), "blocks": blocks}).encode("utf-8")
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack(HEADER_FORMAT, MAGIC, len(meta)))
+            f.write(meta)
+            for data in encoded:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            content = f.read()
+        magic, meta_len = struct.unpack_from(HEADER_FORMAT, content, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an interval partition")
+        meta = json.loads(content[HEADER_SIZE:HEADER_SIZE + meta_len])
+        data = content[HEADER_SIZE + meta_len:]
+        return cls(meta["date"], meta["meter_ids"], meta["blocks"], data, meta["scale"], meta["group_meters"])
+
+    # (opening reading, 48 slot readings) of one meter, decoding only its block
+    def get(self, meter_id):
+        row = self.rows.get(meter_id)
+        if row is None:
+            return None
+        group, row_in_group = divmod(row, self.group_meters)
+        offset, length = self.blocks[group]
+        values = decode_block(self.data[offset:offset + length], self.scale)[row_in_group]
+        return float(values[0]), values[1:]
+
+
+class IntervalStore:
+    def __init__(self, folder=INTERVAL_FOLDER, cache_bytes=CACHE_BYTES):
+        self.folder = folder
+        self.cache_bytes = cache_bytes
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()    # date -> IntervalPartition, least recently used first
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.manifest = {}
+        self.manifest_mtime = None
+
+    def manifest_path(self):
+        return os.path.join(self.folder, MANIFEST)
+
+    # Other processes (reader workers) pick up new days when the manifest changes
+    def refresh(self):
+        try:
+            mtime = os.stat(self.manifest_path()).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self.manifest_mtime:
+            with open(self.manifest_path()) as f:
+                self.manifest = json.load(f)["days"]
+            self.manifest_mtime = mtime
+
+    def dates(self):
+        self.refresh()
+        return sorted(int(date) for date in self.manifest)
+
+    def archive_day(self, date, meter_ids, opening, readings, **figures):
+        os.makedirs(self.folder, exist_ok=True)
+        filename = f"intervals_{int(date)}.elzd"
+        size = IntervalPartition.write(os.path.join(self.folder, filename), date, meter_ids, opening, readings)
+
+        with self.lock:
+            self.refresh()
+            manifest = dict(self.manifest)
+            manifest[str(int(date))] = {"file": filename, "meters": len(meter_ids), "bytes": size, **figures}
+            tmp_path = self.manifest_path() + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"days": manifest}, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path())
+            self.manifest = manifest
+            self.manifest_mtime = os.stat(self.manifest_path()).st_mtime_ns
+            # a rewritten day must not be served from the cache
+            stale = self.cache.pop(int(date), None)
+            if stale is not None:
+                self.cached_bytes -= stale.nbytes
+        return size
+
+    def partition(self, date):
+        date = int(date)
+        with self.lock:
+            partition = self.cache.get(date)
+            if partition is not None:
+                self.cache.move_to_end(date)
+                self.hits += 1
+                return partition
+            self.misses += 1
+            self.refresh()
+            entry = self.manifest.get(str(date))
+        if entry is None:
+            return None
+
+        partition = IntervalPartition.load(os.path.join(self.folder, entry["file"]))
+        with self.lock:
+            if date not in self.cache:
+                self.cache[date] = partition
+                self.cached_bytes += partition.nbytes
+            while self.cached_bytes > self.cache_bytes and len(self.cache) > 1:
+                _, evicted = self.cache.popitem(last=False)
+                self.cached_bytes -= evicted.nbytes
+        return partition
+
+    def get(self, meter_id, date):
+        partition = self.partition(date)
+        return partition.get(meter_id) if partition is not None else None
+
+    def stats(self):
+        with self.lock:
+            return {"days_on_disk": len(self.manifest), "days_cached": len(self.cache),
+                    "cached_bytes": self.cached_bytes, "cache_limit_bytes": self.cache_bytes,
+                    "hits": self.hits, "misses": self.misses}
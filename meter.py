@@ -1,66 +1,177 @@
 # v1
+from http_client import client
+import os
+import time
 import requests
+import threading
 import pandas as pd
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime
+from metrics import metrics
+from meter_store import period_boundaries, usage_figures
 
 METER_API_URL = "http://127.0.0.1:5001/get_meter_data/"
 METER_TODAY_API = "http://127.0.0.1:5002/get_today_data/"
-METER_DAILY_API = "http://127.0.0.1:5002/get_daily_data/"
+METER_BASELINES_API = "http://127.0.0.1:5002/get_baselines/"
+FLEET_SUMMARY_API = "http://127.0.0.1:5002/api/fleet_summary"
+# with reader workers, point this at the ingest process (port 5003): it owns the rollover
+SERVER_STATUS_WATCH_API = os.environ.get("STORE_STATUS_URL", "http://127.0.0.1:5002/api/server_status/watch")
+
+READING_CACHE_SIZE = 100000   # entries, least recently used evicted first
+TODAY_TTL = 60                # seconds; the current day's readings still change
+
+
+MISS = object()
+
+
+# Read-through cache of store_readings answers keyed by (kind, meter_id, date):
+# "live" for today's latest reading, "close" for a day's end-of-day reading.
+# Past days never change, so their entries stay until evicted; entries for
+# today expire after TODAY_TTL. Hits and misses go to app's /metrics.
+class ReadingCache:
+    def __init__(self, max_entries=READING_CACHE_SIZE, today_ttl=TODAY_TTL):
+        self.max_entries = max_entries
+        self.today_ttl = today_ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # key -> (value, expires_at or None)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                self._record("hit")
+                return entry[0]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            self._record("miss")
+            return MISS
+
+    def _record(self, result):
+        metrics.inc("reading_cache_requests_total", result=result)
+        metrics.set("reading_cache_hit_rate", round(self.hits / (self.hits + self.misses), 4))
+
+    def put(self, key, value, final):
+        with self.lock:
+            self.entries[key] = (value, None if final else time.monotonic() + self.today_ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            metrics.set("reading_cache_entries", len(self.entries))
+
+    # fetch() returns (value, "final" | "today" | None); None answers are not cached
+    def get_or_fetch(self, key, fetch):
+        value = self.get(key)
+        if value is not MISS:
+            return value
+        value, lifetime = fetch()
+        if lifetime is not None:
+            self.put(key, value, final=lifetime == "final")
+        return value
+
+
+# Keeps store_readings' status in memory: a background thread long-polls
+# /api/server_status/watch and stores each change, so a page view checks it
+# without a request of its own.
+class StatusWatcher:
+    WATCH_TIMEOUT = 30    # seconds, matches STATUS_WATCH_TIMEOUT in store_readings.py
+    RETRY_DELAY = 2       # seconds between attempts while store_readings is down
+
+    def __init__(self, url=SERVER_STATUS_WATCH_API):
+        self.url = url
+        self.status = None    # None until the first answer / after a failed watch
+        self.thread = None
+        # own session: long-polls would skew the upstream latency metrics of the shared client
+        self.session = requests.Session()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def run(self):
+        while True:
+            version = self.status["version"] if self.status else -1
+            try:
+                response = self.session.get(self.url, params={"version": version, "timeout": self.WATCH_TIMEOUT},
+                                            timeout=(3, self.WATCH_TIMEOUT + 10))
+                response.raise_for_status()
+                status = response.json()
+            except (requests.RequestException, ValueError):
+                self.status = None
+                time.sleep(self.RETRY_DELAY)
+                continue
+            metrics.set("store_status_version", status["version"])
+            self.status = status
+
+    # Unknown status counts as accepting; the summary call then reports "busy" itself
+    def accepting(self):
+        status = self.status
+        return status is None or status.get("acceptAPI", True)
+
+    def state(self):
+        status = self.status
+        return status["state"] if status else "unknown"
+
+
+def today_date():
+    return datetime.now().strftime("%Y%m%d")
+
+
+reading_cache = ReadingCache()
 
 class MeterManager:
     def get_meter_reading(self, meter_id):
-        response = requests.get(f"{METER_API_URL}{meter_id}")
+        response = client.get(f"{METER_API_URL}{meter_id}")
         data = response.json()
         return data.get("reading_kwh", 0)
 
-    def get_past_date(self):
-        now = datetime.now()
-        yesterday = (now - timedelta(days=1)).strftime("%Y%m%d")  
-        last_weekend = (now - timedelta(days=now.weekday() + 1)).strftime("%Y%m%d")  
-        print(last_weekend)
-        last_month_end = (now.replace(day=1) - timedelta(days=1)).strftime("%Y%m%d")  
-        prev_month_end = (now.replace(day=1) - timedelta(days=1)).replace(day=1).strftime("%Y%m%d")  
-        return yesterday, last_weekend, last_month_end, prev_month_end
-
-    def get_meter_data(self, meter_id, api_url, date=None):
-        url = f"{api_url}{meter_id}"
-        if date:
-            url += f"?date={date}"
-        response = requests.get(url)
-        data = response.json()
-        return data.get("reading", 0)
+    # Today's latest and previous reading: changes every half hour, so cached for TODAY_TTL only
+    def get_live_reading(self, meter_id):
+        def fetch():
+            response = client.get(f"{METER_TODAY_API}{meter_id}")
+            data = response.json()
+            if response.status_code == 503 or not data.get("acceptAPI", True):
+                return {"busy": True}, None
+            if response.status_code != 200:
+                return {"error": "No today data found for this meter_id"}, None
+            return {"latest_reading": data["latest_reading"], "previous_reading": data["previous_reading"]}, "today"
 
-    def get_user_usage(self, meter_id):
-        yesterday, last_weekend, last_month_end, prev_month_end = self.get_past_date()
-
-        current_reading = self.get_meter_reading(meter_id)
-
-        response = requests.get(f"{METER_TODAY_API}{meter_id}")
-        today_data = response.json()
+        return reading_cache.get_or_fetch(("live", str(meter_id), today_date()), fetch)
 
-        if "latest_reading" not in today_data:
-            return {"error": "No today data found for this meter_id"}
+    # Reading at the start of each period. Each is the end-of-day reading of a past
+    # boundary date, so it is cached as final under ("close", meter_id, boundary date).
+    def get_baselines(self, meter_id):
+        boundaries = period_boundaries(today_date())
+        cached = {period: reading_cache.get(("close", str(meter_id), str(date))) for period, date in boundaries.items()}
+        if all(reading is not MISS for reading in cached.values()):
+            return cached
 
-        latest_reading = today_data["latest_reading"]
-
-        recent_half_hour_usage = max(0, current_reading - latest_reading)
+        response = client.get(f"{METER_BASELINES_API}{meter_id}")
+        data = response.json()
+        readings = data.get("readings", {})
+        # right after midnight store_readings may still serve yesterday's baselines: use, don't keep
+        if response.status_code == 200 and data.get("date") == int(today_date()):
+            for period, date in boundaries.items():
+                if readings.get(period) is not None:   # a missing day may still be archived
+                    reading_cache.put(("close", str(meter_id), str(date)), readings[period], final=True)
+        return {period: readings.get(period) for period in boundaries}
 
-        yesterday_reading = self.get_meter_data(meter_id, METER_DAILY_API, yesterday)
-        last_weekend_reading = self.get_meter_data(meter_id, METER_DAILY_API, last_weekend)
-        print(last_weekend_reading)
-        last_month_end_reading = self.get_meter_data(meter_id, METER_DAILY_API, last_month_end)
-        prev_month_end_reading = self.get_meter_data(meter_id, METER_DAILY_API, prev_month_end)
+    # Worked out here from the live reading and the cached baselines, with the
+    # same usage_figures as /get_usage_summary, so a dashboard refresh is mostly cache hits
+    def get_user_usage(self, meter_id):
+        live = self.get_live_reading(meter_id)
+        if "busy" in live or "error" in live:
+            return live
 
-        today_usage = max(0, current_reading - yesterday_reading)
-        week_usage = max(0, current_reading - last_weekend_reading)
-        print(week_usage)
-        month_usage = max(0, current_reading - last_month_end_reading)
-        last_month_usage = max(0, last_month_end_reading - prev_month_end_reading)
+        return usage_figures(live["latest_reading"], live["previous_reading"], self.get_baselines(meter_id))
 
-        return {
-            "recent_half_hour_usage": round(recent_half_hour_usage, 4),
-            "today_usage": round(today_usage, 4),
-            "week_usage": round(week_usage, 4),
-            "month_usage": round(month_usage, 4),
-            "last_month_usage": round(last_month_usage, 4)
-        }
+    # Fleet total and peak half hour for the administrator page
+    def get_fleet_summary(self):
+        response = client.get(FLEET_SUMMARY_API)
+        return response.json()
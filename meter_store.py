@@ -0,0 +1,494 @@
+# v1
+import numpy as np
+from datetime import datetime, timedelta
+
+SLOTS_PER_DAY = 48
+INITIAL_METERS = 1024
+INITIAL_DAYS = 64
+
+
+# "HHMM" (or the unpadded ints in the CSV, e.g. "30", "130") -> half-hour slot 0..47
+def timestamp_to_slot(timestamp):
+    hours, minutes = divmod(int(timestamp), 100)
+    return hours * 2 + minutes // 30
+
+
+def slot_to_timestamp(slot):
+    return f"{slot // 2:02d}{(slot % 2) * 30:02d}"
+
+
+def timestamps_to_slots(timestamps):
+    hours, minutes = np.divmod(np.asarray(timestamps, dtype=np.int64), 100)
+    return hours * 2 + minutes // 30
+
+
+# Meter ID -> row number, shared by both stores.
+# Rows are handed out in arrival order and never reused.
+
+class MeterIndex:
+    def __init__(self, meter_ids=()):
+        self.meter_ids = list(meter_ids)
+        self.rows = {meter_id: row for row, meter_id in enumerate(self.meter_ids)}
+
+    def __len__(self):
+        return len(self.meter_ids)
+
+    def __contains__(self, meter_id):
+        return meter_id in self.rows
+
+    def get(self, meter_id):
+        return self.rows.get(meter_id)
+
+    def add(self, meter_id):
+        row = self.rows.get(meter_id)
+        if row is None:
+            row = len(self.meter_ids)
+            self.rows[meter_id] = row
+            self.meter_ids.append(meter_id)
+        return row
+
+    # how many rows lookup(meter_ids) would add
+    def count_new(self, meter_ids):
+        return len(set(meter_ids).difference(self.rows))
+
+    def lookup(self, meter_ids):
+        return np.fromiter((self.add(meter_id) for meter_id in meter_ids), dtype=np.int64, count=len(meter_ids))
+
+
+# Today's readings: one float64 per (meter, half-hour slot), NaN when missing
+
+class TodayStore:
+    def __init__(self, date=None, capacity=INITIAL_METERS):
+        self.date = date
+        self.index = MeterIndex()
+        self.readings = np.full((capacity, SLOTS_PER_DAY), np.nan)
+        # latest slot / reading per meter, kept up to date at ingest so that
+        # "latest reading" never has to scan the slots
+        self.latest_slot = np.full(capacity, -1, dtype=np.int8)
+        self.latest_value = np.full(capacity, np.nan)
+        self.last_slot = -1   # latest slot of any meter
+        self.reporting = 0    # meters with a reading today (opening-only rows don't count)
+        # previous day's closing reading, the base for each meter's first reading today
+        self.opening_value = np.full(capacity, np.nan)
+
+        # fleet aggregates, also kept up to date at ingest: kWh used per slot
+        # across all meters, the day's total, and the busiest slot so far
+        self.slot_totals = np.zeros(SLOTS_PER_DAY)
+        self.daily_total = 0.0
+        self.peak_slot = -1
+        self.peak_load = 0.0
+
+    # Build a store in one go from a (meters x 48) matrix, e.g. at restore
+    @classmethod
+    def from_arrays(cls, date, meter_ids, readings, opening=None):
+        n = len(meter_ids)
+        store = cls(date, capacity=max(INITIAL_METERS, n))
+        store.index = MeterIndex(meter_ids)
+        store.readings[:n] = readings
+        if opening is not None:
+            store.set_opening(*opening)
+
+        filled = ~np.isnan(store.readings[:n])
+        slots = SLOTS_PER_DAY - 1 - np.argmax(filled[:, ::-1], axis=1)
+        slots[~filled.any(axis=1)] = -1
+        store.latest_slot[:n] = slots
+        store.latest_value[:n] = np.where(slots >= 0, store.readings[np.arange(n), np.maximum(slots, 0)], np.nan)
+        store.last_slot = int(slots.max()) if n else -1
+        store.reporting = int((slots >= 0).sum())
+
+        # usage per slot = reading minus the meter's previous reading (or its opening value)
+        previous_slot = np.where(filled, np.arange(SLOTS_PER_DAY), -1)
+        np.maximum.accumulate(previous_slot, axis=1, out=previous_slot)
+        previous_slot = np.hstack([np.full((n, 1), -1), previous_slot[:, :-1]])
+        rows = np.arange(n)[:, None]
+        previous = np.where(previous_slot >= 0, store.readings[rows, np.maximum(previous_slot, 0)],
+                            store.opening_value[:n, None])
+        usage = np.nan_to_num(np.clip(store.readings[:n] - previous, 0, None))
+        store.slot_totals = usage.sum(axis=0)
+        store.daily_total = float(store.slot_totals.sum())
+        if store.daily_total > 0:
+            store.peak_slot = int(np.argmax(store.slot_totals))
+            store.peak_load = float(store.slot_totals[store.peak_slot])
+        return store
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, meter_id):
+        row = self.index.get(meter_id)
+        return row is not None and self.latest_slot[row] >= 0
+
+    @property
+    def meter_ids(self):
+        return self.index.meter_ids
+
+    def _reserve(self, n_meters):
+        capacity = self.readings.shape[0]
+        if n_meters <= capacity:
+            return
+        capacity = max(capacity, 1)   # stores restored from a checkpoint / shared state are exactly n rows
+        while capacity < n_meters:
+            capacity *= 2
+        old = self.readings.shape[0]
+        grown = np.full((capacity, SLOTS_PER_DAY), np.nan)
+        grown[:old] = self.readings
+        latest_slot = np.full(capacity, -1, dtype=np.int8)
+        latest_slot[:old] = self.latest_slot
+        latest_value = np.full(capacity, np.nan)
+        latest_value[:old] = self.latest_value
+        opening_value = np.full(capacity, np.nan)
+        opening_value[:old] = self.opening_value
+        self.readings, self.latest_slot, self.latest_value = grown, latest_slot, latest_value
+        self.opening_value = opening_value
+
+    def set_opening(self, meter_ids, values):
+        self._reserve(len(self.index) + self.index.count_new(meter_ids))
+        rows = self.index.lookup(meter_ids)
+        self.opening_value[rows] = values
+
+    # rows are reserved before the index grows, so a concurrent reader never
+    # finds a row that is past the end of the array
+    def set_readings(self, slot, meter_ids, values):
+        self._reserve(len(self.index) + self.index.count_new(meter_ids))
+        rows = self.index.lookup(meter_ids)
+        values = np.asarray(values, dtype=np.float64)
+        self.readings[rows, slot] = values
+
+        # a reading that arrives late (for an earlier slot) leaves the pointer
+        # and the fleet aggregates alone
+        newer = (self.latest_slot[rows] <= slot) & ~np.isnan(values)
+        previous = np.where(self.latest_slot[rows] >= 0, self.latest_value[rows], self.opening_value[rows])
+        usage = np.nan_to_num(np.clip(values[newer] - previous[newer], 0, None))
+        first = newer & (self.latest_slot[rows] < 0)
+        if first.any():
+            self.reporting += len(np.unique(rows[first]))
+        if usage.size:
+            load = float(usage.sum())
+            self.slot_totals[slot] += load
+            self.daily_total += load
+            if self.slot_totals[slot] > self.peak_load:
+                self.peak_slot = slot
+                self.peak_load = float(self.slot_totals[slot])
+
+        self.latest_slot[rows[newer]] = slot
+        self.latest_value[rows[newer]] = values[newer]
+        if newer.any():
+            self.last_slot = max(self.last_slot, slot)
+
+    def set_reading(self, meter_id, slot, value):
+        self.set_readings(slot, [meter_id], [value])
+
+    def get_reading(self, meter_id, slot):
+        row = self.index.get(meter_id)
+        if row is None or np.isnan(self.readings[row, slot]):
+            return None
+        return float(self.readings[row, slot])
+
+    # (slot, reading) of the latest reading of one meter, or None
+    def latest(self, meter_id):
+        row = self.index.get(meter_id)
+        if row is None or self.latest_slot[row] < 0:
+            return None
+        return int(self.latest_slot[row]), float(self.latest_value[row])
+
+    # Last reading of one meter strictly before a slot, or None
+    def reading_before(self, meter_id, slot):
+        row = self.index.get(meter_id)
+        if row is None:
+            return None
+        filled = np.flatnonzero(~np.isnan(self.readings[row, :slot]))
+        if len(filled) == 0:
+            return None
+        return float(self.readings[row, filled[-1]])
+
+    # Latest slot and reading of every meter; slot is -1 when a meter has none
+    def latest_all(self):
+        n = len(self.index)
+        return self.index.meter_ids[:n], self.latest_slot[:n].astype(np.int64), self.latest_value[:n].copy()
+
+    # One meter's opening reading and its 48 slots, or None
+    def interval_row(self, meter_id):
+        row = self.index.get(meter_id)
+        if row is None:
+            return None
+        return float(self.opening_value[row]), self.readings[row].copy()
+
+    # (meter_ids, opening readings, meters x 48 readings) for the whole day
+    def interval_arrays(self):
+        n = len(self.index)
+        return list(self.index.meter_ids[:n]), self.opening_value[:n].copy(), self.readings[:n].copy()
+
+    # Every meter's reading in one slot, NaN when missing
+    def slot_readings(self, slot):
+        n = len(self.index)
+        return self.index.meter_ids[:n], self.readings[:n, slot].copy()
+
+    def clear(self, date=None):
+        self.__init__(date)
+
+    # (meta, arrays) form, used to share the store with reader processes
+    def export_state(self):
+        n = len(self.index)
+        meta = {"date": self.date, "last_slot": self.last_slot, "reporting": self.reporting,
+                "daily_total": self.daily_total, "peak_slot": self.peak_slot, "peak_load": self.peak_load}
+        arrays = {"meter_ids": np.array(self.index.meter_ids[:n], dtype=str),
+                  "readings": self.readings[:n], "latest_slot": self.latest_slot[:n],
+                  "latest_value": self.latest_value[:n], "opening_value": self.opening_value[:n],
+                  "slot_totals": self.slot_totals}
+        return meta, arrays
+
+    @classmethod
+    def import_state(cls, meta, arrays):
+        store = cls.__new__(cls)
+        store.date = meta["date"]
+        store.last_slot = meta["last_slot"]
+        store.daily_total = meta["daily_total"]
+        store.peak_slot = meta["peak_slot"]
+        store.peak_load = meta["peak_load"]
+        store.index = MeterIndex(arrays["meter_ids"].tolist())
+        for name in ("readings", "latest_slot", "latest_value", "opening_value", "slot_totals"):
+            setattr(store, name, arrays[name])
+        store.reporting = meta.get("reporting", int((store.latest_slot >= 0).sum()))   # older checkpoints
+        return store
+
+
+# End-of-day readings: one float64 per (meter, date), NaN when missing.
+# Date columns are kept in ascending order so ranges can be binary searched.
+
+class DailyStore:
+    def __init__(self, capacity=INITIAL_METERS, days=INITIAL_DAYS):
+        self.index = MeterIndex()
+        self.dates = np.zeros(days, dtype=np.int64)
+        self.n_days = 0
+        self.readings = np.full((capacity, days), np.nan)
+        self.owns_arrays = True
+
+    # Build a store in one go from a (meters x days) matrix with ascending dates
+    @classmethod
+    def from_arrays(cls, meter_ids, dates, readings):
+        store = cls(capacity=max(INITIAL_METERS, len(meter_ids)), days=max(INITIAL_DAYS, len(dates)))
+        store.index = MeterIndex(meter_ids)
+        store.n_days = len(dates)
+        store.dates[:store.n_days] = dates
+        store.readings[:len(meter_ids), :store.n_days] = readings
+        return store
+
+    # A copy for building the next snapshot while readers keep using this one.
+    # The arrays are shared: appending a new last date only touches a column
+    # this snapshot cannot see. Anything that would change a visible cell
+    # copies the arrays first (see _own).
+    def fork(self):
+        forked = DailyStore.__new__(DailyStore)
+        forked.index = MeterIndex()
+        forked.index.rows = dict(self.index.rows)
+        forked.index.meter_ids = list(self.index.meter_ids)
+        forked.dates = self.dates
+        forked.n_days = self.n_days
+        forked.readings = self.readings
+        forked.owns_arrays = False
+        return forked
+
+    def _own(self):
+        if not self.owns_arrays:
+            self.readings = self.readings.copy()
+            self.dates = self.dates.copy()
+            self.owns_arrays = True
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, meter_id):
+        return meter_id in self.index
+
+    @property
+    def meter_ids(self):
+        return self.index.meter_ids
+
+    def _reserve(self, n_meters, n_days):
+        capacity, days = self.readings.shape
+        if n_meters <= capacity and n_days <= days:
+            return
+        capacity, days = max(capacity, 1), max(days, 1)
+        while capacity < n_meters:
+            capacity *= 2
+        while days < n_days:
+            days *= 2
+        grown = np.full((capacity, days), np.nan)
+        grown[:self.readings.shape[0], :self.readings.shape[1]] = self.readings
+        self.readings = grown
+        grown_dates = np.zeros(days, dtype=np.int64)
+        grown_dates[:self.n_days] = self.dates[:self.n_days]
+        self.dates = grown_dates
+        self.owns_arrays = True
+
+    # Column of a date, or None if that date was never archived
+    def column(self, date):
+        col = int(np.searchsorted(self.dates[:self.n_days], date))
+        if col < self.n_days and self.dates[col] == date:
+            return col
+        return None
+
+    def _add_date(self, date):
+        col = self.column(date)
+        if col is not None:
+            self._own()
+            return col
+        self._reserve(len(self.index), self.n_days + 1)
+        col = int(np.searchsorted(self.dates[:self.n_days], date))
+        if col < self.n_days:
+            # an older date arriving late: shift later columns right by one
+            self._own()
+            self.dates[col + 1:self.n_days + 1] = self.dates[col:self.n_days]
+            self.readings[:, col + 1:self.n_days + 1] = self.readings[:, col:self.n_days]
+            self.readings[:, col] = np.nan
+        self.dates[col] = date
+        self.n_days += 1
+        return col
+
+    def set_day(self, date, meter_ids, values):
+        self._reserve(len(self.index) + self.index.count_new(meter_ids), self.n_days)
+        col = self._add_date(date)
+        rows = self.index.lookup(meter_ids)
+        self.readings[rows, col] = values
+
+    def set_reading(self, meter_id, date, value):
+        self.set_day(date, [meter_id], [value])
+
+    # Every meter's reading on the last archived date before `date`, e.g. the
+    # opening readings for that day
+    def readings_before(self, date):
+        col = int(np.searchsorted(self.dates[:self.n_days], date)) - 1
+        if col < 0:
+            return [], np.empty(0)
+        n = len(self.index)
+        return self.index.meter_ids[:n], self.readings[:n, col].copy()
+
+    # Readings of some meters for archived dates start..end (inclusive), found by
+    # binary search on the sorted dates. Deltas are the day-on-day usage; the
+    # first one is measured from the last archived day before start.
+    # Returns (dates, readings, deltas) with one row per meter, NaN when missing.
+    def range(self, meter_ids, start, end):
+        dates = self.dates[:self.n_days]
+        lo = int(np.searchsorted(dates, start, side="left"))
+        hi = int(np.searchsorted(dates, end, side="right"))
+        first = max(lo - 1, 0)
+
+        rows = np.array([self.index.get(meter_id) if meter_id in self.index else -1 for meter_id in meter_ids],
+                        dtype=np.int64)
+        window = np.full((len(rows), hi - first), np.nan)
+        known = rows >= 0
+        window[known] = self.readings[rows[known], first:hi]
+
+        if lo > 0:
+            readings = window[:, 1:]
+            deltas = np.diff(window, axis=1)
+        else:
+            readings = window
+            deltas = np.hstack([np.full((len(rows), 1), np.nan), np.diff(window, axis=1)])[:, :hi - lo]
+        return dates[lo:hi].copy(), readings, deltas
+
+    def get_reading(self, meter_id, date):
+        row = self.index.get(meter_id)
+        col = self.column(date)
+        if row is None or col is None or np.isnan(self.readings[row, col]):
+            return None
+        return float(self.readings[row, col])
+
+    def clear(self):
+        self.__init__()
+
+    def export_state(self):
+        n = len(self.index)
+        meta = {"n_days": self.n_days}
+        arrays = {"meter_ids": np.array(self.index.meter_ids[:n], dtype=str),
+                  "dates": self.dates[:self.n_days], "readings": self.readings[:n, :self.n_days]}
+        return meta, arrays
+
+    @classmethod
+    def import_state(cls, meta, arrays):
+        store = cls.__new__(cls)
+        store.index = MeterIndex(arrays["meter_ids"].tolist())
+        store.n_days = meta["n_days"]
+        store.dates = arrays["dates"]
+        store.readings = arrays["readings"]
+        store.owns_arrays = False
+        return store
+
+
+# Reading each period's usage is measured from, per period name.
+# "prev_month" matches the original page: the 1st of last month.
+PERIODS = ("day", "week", "month", "prev_month", "quarter", "year")
+
+
+def period_boundaries(date):
+    today = datetime.strptime(str(date), "%Y%m%d")
+    last_month_end = today.replace(day=1) - timedelta(days=1)
+    quarter_start = today.replace(month=(today.month - 1) // 3 * 3 + 1, day=1)
+    boundaries = {
+        "day": today - timedelta(days=1),
+        "week": today - timedelta(days=today.weekday() + 1),
+        "month": last_month_end,
+        "prev_month": last_month_end.replace(day=1),
+        "quarter": quarter_start - timedelta(days=1),
+        "year": today.replace(month=1, day=1) - timedelta(days=1),
+    }
+    return {period: int(boundary.strftime("%Y%m%d")) for period, boundary in boundaries.items()}
+
+
+# Usage figures of one meter from its latest reading, the reading before it
+# (None: the first today) and its {period: baseline}. Shared by
+# store_readings /get_usage_summary and meter.MeterManager.get_user_usage.
+def usage_figures(current_reading, previous_reading, baselines):
+    # missing history counts as 0, as the per-date lookups did
+    base = {period: reading or 0 for period, reading in baselines.items()}
+    if previous_reading is None:
+        previous_reading = base["day"]
+    return {
+        "recent_half_hour_usage": round(max(0, current_reading - previous_reading), 4),
+        "today_usage": round(max(0, current_reading - base["day"]), 4),
+        "week_usage": round(max(0, current_reading - base["week"]), 4),
+        "month_usage": round(max(0, current_reading - base["month"]), 4),
+        "last_month_usage": round(max(0, base["month"] - base["prev_month"]), 4),
+        "quarter_usage": round(max(0, current_reading - base["quarter"]), 4),
+        "year_usage": round(max(0, current_reading - base["year"]), 4)
+    }
+
+
+# Per-meter baseline readings for every period, materialized from the daily
+# store once per day (at the nightly archive), so period usage is one subtraction
+
+class PeriodBaselines:
+    def __init__(self, date=None, meter_ids=(), boundaries=None, readings=None):
+        self.date = date
+        self.index = MeterIndex(meter_ids)
+        self.boundaries = boundaries or {}
+        self.readings = readings if readings is not None else np.full((0, len(PERIODS)), np.nan)
+
+    @classmethod
+    def build(cls, daily, date):
+        boundaries = period_boundaries(date)
+        n = len(daily.index)
+        readings = np.full((n, len(PERIODS)), np.nan)
+        for i, period in enumerate(PERIODS):
+            col = daily.column(boundaries[period])
+            if col is not None:
+                readings[:, i] = daily.readings[:n, col]
+        return cls(date, daily.meter_ids[:n], boundaries, readings)
+
+    # {period: reading or None} for one meter
+    def get(self, meter_id):
+        row = self.index.get(meter_id)
+        if row is None:
+            return {period: None for period in PERIODS}
+        return {period: (None if np.isnan(value) else float(value))
+                for period, value in zip(PERIODS, self.readings[row])}
+
+    def export_state(self):
+        n = len(self.index)
+        meta = {"date": self.date, "boundaries": self.boundaries}
+        arrays = {"meter_ids": np.array(self.index.meter_ids[:n], dtype=str), "readings": self.readings[:n]}
+        return meta, arrays
+
+    @classmethod
+    def import_state(cls, meta, arrays):
+        return cls(meta["date"], arrays["meter_ids"].tolist(), meta["boundaries"], arrays["readings"])
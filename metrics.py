@@ -0,0 +1,216 @@
+# v1
+import sys
+import json
+import time
+import bisect
+import logging
+import threading
+from datetime import datetime
+from flask import g, request, jsonify, Response
+
+# Shared instrumentation for app.py, mock_meter.py and store_readings.py.
+#
+# metrics.observe(name, seconds, **labels)   latency histogram
+# metrics.inc(name, value, **labels)         counter
+# metrics.set(name, value, **labels)         gauge
+# metrics.add_collector(fn)                  fn(metrics) refreshes gauges on each read
+# log_event(event, **fields)                 one JSON line on stdout
+#
+# instrument(app, service) times every Flask route and serves everything on
+# GET /metrics (JSON, or Prometheus text with ?format=prometheus).
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1, 2.5, 5, 10, 30, 60, 300, 1800)   # seconds, upper bounds
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)   # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    # Upper bound of the bucket holding the q-th observation
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum_seconds": round(self.sum, 6),
+            "avg_seconds": round(self.sum / self.count, 6) if self.count else None,
+            "max_seconds": round(self.max, 6),
+            "p50_seconds": self.quantile(0.50),
+            "p95_seconds": self.quantile(0.95),
+            "p99_seconds": self.quantile(0.99),
+            "buckets": [[bound, count] for bound, count in zip(BUCKETS + ("+Inf",), self.counts)],
+        }
+
+
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.service = None
+        self.started = time.time()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.collectors = []   # called before each read of /metrics to refresh gauges
+
+    def observe(self, name, seconds, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, label_key(labels))] = value
+
+    # collector() sets gauges that are cheaper to read on demand than to keep current
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def collect(self):
+        for collector in self.collectors:
+            collector(self)
+
+    # with metrics.timer("archive_seconds", target="history_file"): ...
+    def timer(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def snapshot(self):
+        self.collect()
+
+        def entries(series, to_value):
+            grouped = {}
+            for (name, labels), value in sorted(series.items()):
+                grouped.setdefault(name, []).append({"labels": dict(labels), **to_value(value)})
+            return grouped
+
+        with self.lock:
+            return {
+                "service": self.service,
+                "uptime_seconds": round(time.time() - self.started, 3),
+                "histograms": entries(self.histograms, lambda h: h.to_dict()),
+                "counters": entries(self.counters, lambda v: {"value": v}),
+                "gauges": entries(self.gauges, lambda v: {"value": v}),
+            }
+
+    def prometheus(self):
+        def labels_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}" if pairs else ""
+
+        self.collect()
+        lines = []
+        with self.lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{labels_text(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{labels_text(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{labels_text(labels)} {histogram.count}")
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{name}{labels_text(labels)} {value}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                lines.append(f"{name}{labels_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.seconds = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+        self.metrics.observe(self.name, self.seconds, **self.labels)
+        return False
+
+
+metrics = Metrics()
+logger = logging.getLogger("electricity")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "service": metrics.service,
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }, default=str)
+
+
+def configure_logging(level=logging.INFO):
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def log_event(event, level=logging.INFO, **fields):
+    logger.log(level, event, extra={"fields": fields})
+
+
+def instrument(app, service):
+    metrics.service = service
+    configure_logging()
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        started = getattr(g, "metrics_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            metrics.observe("http_request_seconds", time.perf_counter() - started,
+                            route=route, method=request.method, status=response.status_code)
+        return response
+
+    def metrics_view():
+        if request.args.get("format") == "prometheus":
+            return Response(metrics.prometheus(), mimetype="text/plain; version=0.0.4")
+        return jsonify(metrics.snapshot())
+
+    app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
+    return app
@@ -3,20 +3,19 @@ import time
 import random
 import json
 import os
+import logging
 import requests
+from http_client import client
+from metrics import metrics, instrument, log_event
+import threading
+import numpy as np
 from datetime import datetime
 
-USER_DATA_FILE = "users.json"
 METERS_FOLDER = "meter_data"
 USER_API_URL = "http://127.0.0.1:5000/meter_ids"
-
-# load user info
-
-def load_users():
-    if os.path.exists(USER_DATA_FILE):
-        with open(USER_DATA_FILE, "r") as f:
-            return json.load(f)
-    return {}
+SIMULATION_SNAPSHOT = os.path.join(METERS_FOLDER, "simulation.npz")
+SNAPSHOT_INTERVAL = 60        # seconds between simulation snapshots
+METER_REFRESH_INTERVAL = 60   # seconds between checks for newly registered meters
 
 # Read or create meter reading TXT
 
@@ -44,39 +43,40 @@ def get_next_usage():
     return round(random.uniform(0.1, 1.0), 8)
 
 def load_meter_ids():
-    response = requests.get(USER_API_URL)
+    response = client.get(USER_API_URL)
     meter_ids = response.json()
     return meter_ids
 
-def check_meter_id():
-    meter_ids = load_meter_ids()
-    users = load_users()
-    meters = {u: os.path.join(METERS_FOLDER, f"meter_{data['meter_id']}.txt") for u, data in users.items()}
-    
+def check_meter_id(meter_ids=None):
+    if meter_ids is None:
+        meter_ids = load_meter_ids()
+
     if not os.path.exists(METERS_FOLDER):
         os.makedirs(METERS_FOLDER)
     
+    created = 0
     for meter_id in meter_ids:
         meter_file = os.path.join(METERS_FOLDER, f"meter_{meter_id}.txt")
         if not os.path.exists(meter_file): 
             with open(meter_file, "w") as f:
                 f.write("0.0")
-            print(f"Created missing meter file: {meter_file}")
+            created += 1
+    if created:
+        log_event("meter_files_created", count=created, folder=METERS_FOLDER)
 
 
 def run_meters():
     
     os.makedirs(METERS_FOLDER, exist_ok=True)
-    print("Mock Meter started...\n")
+    log_event("mock_meter_started", mode="files")
 
     while True:
-        users = load_users()
-        check_meter_id()
-        meters = {u: os.path.join(METERS_FOLDER, f"meter_{data['meter_id']}.txt") for u, data in users.items()}
+        meter_ids = load_meter_ids()   # registered users live in app.py's user store
+        check_meter_id(meter_ids)
+        meters = {meter_id: os.path.join(METERS_FOLDER, f"meter_{meter_id}.txt") for meter_id in meter_ids}
+        started = time.perf_counter()
 
-        print(f"Now updating {len(meters)} meters...\n")
-
-        for username, meter_file in meters.items():
+        for meter_id, meter_file in meters.items():
             if not os.path.exists(meter_file):
                 with open(meter_file, "w") as f:
                     f.write("0.00")
@@ -85,19 +85,132 @@ def run_meters():
             usage = get_next_usage()
             kwh += usage
             save_total_kwh(meter_file, kwh)
-            print(f"{datetime.now().strftime('%H:%M:%S')} - {username}: {kwh:.8f} kWh")
+
+        # one line per pass, not per meter
+        elapsed = time.perf_counter() - started
+        metrics.observe("meter_update_pass_seconds", elapsed)
+        metrics.set("meters_simulated", len(meters))
+        log_event("meters_updated", meters=len(meters), seconds=round(elapsed, 4))
 
         time.sleep(1)
 
 
+# Simulation mode: every meter total lives in one NumPy array and a tick is a
+# single vectorized increment. State is snapshotted to disk every
+# SNAPSHOT_INTERVAL seconds instead of rewriting one file per meter per tick.
+
+class MeterSimulator:
+    def __init__(self, meter_ids=(), totals=None):
+        self.meter_ids = [str(meter_id) for meter_id in meter_ids]
+        self.rows = {meter_id: row for row, meter_id in enumerate(self.meter_ids)}
+        self.totals = np.zeros(len(self.meter_ids)) if totals is None else np.asarray(totals, dtype=np.float64)
+        self.rng = np.random.default_rng()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.meter_ids)
+
+    # New meters start from their TXT reading if one exists, else 0
+    def add_meters(self, meter_ids):
+        new_ids = [str(meter_id) for meter_id in meter_ids if str(meter_id) not in self.rows]
+        if not new_ids:
+            return
+        existing = set(os.listdir(METERS_FOLDER)) if os.path.isdir(METERS_FOLDER) else set()
+        start = [load_total_kwh(os.path.join(METERS_FOLDER, f"meter_{meter_id}.txt"))
+                 if f"meter_{meter_id}.txt" in existing else 0.0 for meter_id in new_ids]
+        with self.lock:
+            self.totals = np.concatenate([self.totals, start])
+            for meter_id in new_ids:
+                self.rows[meter_id] = len(self.meter_ids)
+                self.meter_ids.append(meter_id)
+
+    # Same distribution as get_next_usage, for every meter at once
+    def tick(self):
+        with self.lock:
+            self.totals += self.rng.uniform(0.1, 1.0, len(self.totals))
+
+    def reading(self, meter_id):
+        row = self.rows.get(meter_id)
+        if row is None:
+            return None
+        return float(self.totals[row])
+
+    def readings(self, meter_ids):
+        totals = self.totals
+        return {meter_id: (float(totals[self.rows[meter_id]]) if meter_id in self.rows else None)
+                for meter_id in meter_ids}
+
+    def snapshot(self, path=SIMULATION_SNAPSHOT):
+        with self.lock:
+            meter_ids = np.array(self.meter_ids)
+            totals = self.totals.copy()
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, meter_ids=meter_ids, totals=totals)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=SIMULATION_SNAPSHOT):
+        with np.load(path) as snapshot:
+            return cls(snapshot["meter_ids"].tolist(), snapshot["totals"])
+
+
+simulator = None
+
+
+# Registered meters, or a synthetic fleet of n_meters for load testing
+def start_simulation(n_meters=None):
+    global simulator
+
+    os.makedirs(METERS_FOLDER, exist_ok=True)
+    if os.path.exists(SIMULATION_SNAPSHOT):
+        simulator = MeterSimulator.load()
+    else:
+        simulator = MeterSimulator()
+
+    if n_meters:
+        simulator.add_meters(str(100000001 + i) for i in range(n_meters))
+    else:
+        simulator.add_meters(load_meter_ids())
+    metrics.set("meters_simulated", len(simulator))
+    log_event("mock_meter_started", mode="simulation", meters=len(simulator))
+    return simulator
+
+
+def run_simulation(n_meters=None):
+
+    last_snapshot = last_refresh = time.monotonic()
+
+    while True:
+        started = time.monotonic()
+        with metrics.timer("meter_tick_seconds"):
+            simulator.tick()
+
+        if not n_meters and started - last_refresh >= METER_REFRESH_INTERVAL:
+            try:
+                simulator.add_meters(load_meter_ids())
+            except requests.RequestException as e:
+                log_event("meter_refresh_failed", error=str(e))
+            last_refresh = started
+
+        if started - last_snapshot >= SNAPSHOT_INTERVAL:
+            with metrics.timer("meter_snapshot_seconds") as timer:
+                simulator.snapshot()
+            last_snapshot = started
+            metrics.set("meters_simulated", len(simulator))
+            log_event("snapshot_saved", meters=len(simulator), seconds=round(timer.seconds, 4))
+
+        time.sleep(max(0, 1 - (time.monotonic() - started)))
+
+
 
 # Meter data output API
 
 import os
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 from concurrent.futures import ThreadPoolExecutor
 
 app = Flask(__name__)
+instrument(app, "mock_meter")
 executor = ThreadPoolExecutor(max_workers=5)
 
 def read_meter_data(meter_id):
@@ -111,6 +224,15 @@ def read_meter_data(meter_id):
 @app.route("/get_meter_data/<meter_id>", methods=["GET"])
 def get_meter_data(meter_id):
 
+    if simulator is not None:
+        reading = simulator.reading(meter_id)
+        if reading is None:
+            return jsonify({"meter_id": meter_id, "message": "Unknown meter ID."}), 404
+        return jsonify({
+            "meter_id": meter_id,
+            "reading_kwh": reading
+        })
+
     future = executor.submit(read_meter_data, meter_id)
     reading = future.result()
 
@@ -120,14 +242,211 @@ def get_meter_data(meter_id):
     })
 
 
-import threading
+# Bulk meter data API: readings for many meters in one response
+
+def list_meter_ids():
+
+    if simulator is not None:
+        return list(simulator.meter_ids)
+
+    meter_ids = []
+    for name in os.listdir(METERS_FOLDER):
+        if name.startswith("meter_") and name.endswith(".txt"):
+            meter_ids.append(name[len("meter_"):-len(".txt")])
+    return meter_ids
+
+
+def read_meter_data_bulk(meter_ids):
+
+    if simulator is not None:
+        return simulator.readings(meter_ids)
+
+    readings = {}
+    for meter_id in meter_ids:
+        try:
+            readings[meter_id] = read_meter_data(meter_id)
+        except (OSError, ValueError):
+            readings[meter_id] = None
+    return readings
+
+
+# POST {"meter_ids": [...]} reads the given meters, GET reads every meter
+@app.route("/get_meter_data_bulk", methods=["GET", "POST"])
+def get_meter_data_bulk():
+
+    if request.method == "POST":
+        meter_ids = (request.get_json(silent=True) or {}).get("meter_ids")
+        if not isinstance(meter_ids, list):
+            return jsonify({"error": "Missing required field: meter_ids"}), 400
+    else:
+        meter_ids = list_meter_ids()
+
+    future = executor.submit(read_meter_data_bulk, [str(m) for m in meter_ids])
+    readings = future.result()
+
+    return jsonify({
+        "count": len(readings),
+        "readings": readings
+    })
+
+
+# Push mode: a gateway sends every meter's reading to store_readings at each
+# half-hour boundary, PUSH_BATCH_SIZE readings per request. Batches that are
+# not accepted stay in a buffer and go out with the next push, so one request
+# can carry several slots.
+
+# with reader workers, point this at the ingest process (port 5003): readers refuse writes
+STORE_INGEST_URL = os.environ.get("STORE_INGEST_URL", "http://127.0.0.1:5002/ingest")
+PUSH_INTERVAL = 30 * 60      # seconds, aligned to :00 / :30
+PUSH_BATCH_SIZE = 5000       # readings per request
+PUSH_BUFFER_LIMIT = 1000     # unsent batches kept while store_readings is down
+
+
+class PushGateway:
+    def __init__(self, url=STORE_INGEST_URL, batch_size=PUSH_BATCH_SIZE, interval=PUSH_INTERVAL):
+        self.url = url
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending = []    # (date, timestamp, meter_ids, readings), oldest first
+        self.lock = threading.Lock()
+
+    def collect(self):
+        if simulator is not None:
+            with simulator.lock:
+                return list(simulator.meter_ids), simulator.totals.tolist()
+        readings = read_meter_data_bulk(list_meter_ids())
+        meter_ids = [meter_id for meter_id, reading in readings.items() if reading is not None]
+        return meter_ids, [readings[meter_id] for meter_id in meter_ids]
+
+    # Requests of up to batch_size readings; slots of the same date travel together
+    def pack(self, pending):
+        requests_out = []
+        for date, timestamp, meter_ids, readings in pending:
+            last = requests_out[-1] if requests_out else None
+            if last is None or last["date"] != date or last["size"] + len(meter_ids) > self.batch_size:
+                last = {"date": date, "size": 0, "entries": []}
+                requests_out.append(last)
+            last["entries"].append((date, timestamp, meter_ids, readings))
+            last["size"] += len(meter_ids)
+        return requests_out
+
+    def send(self, batch):
+        body = {"date": batch["date"], "slots": [
+            {"timestamp": timestamp, "meter_ids": meter_ids, "readings": readings}
+            for _, timestamp, meter_ids, readings in batch["entries"]]}
+        try:
+            response = client.post(self.url, json=body)
+        except requests.RequestException as e:
+            log_event("push_failed", date=batch["date"], readings=batch["size"], error=str(e))
+            return False
+        if response.status_code == 421:
+            # a reader worker, not the ingest process: resending there never helps
+            log_event("push_misdirected", level=logging.ERROR, url=self.url, date=batch["date"],
+                      readings=batch["size"], status=response.status_code)
+            metrics.inc("push_batches_misdirected_total")
+            return None
+        if response.status_code >= 400:
+            # 409: store_readings has not rolled over to this date yet, try again next push
+            log_event("push_rejected", date=batch["date"], readings=batch["size"], status=response.status_code)
+            return False
+        return True
+
+    def push(self):
+        now = datetime.now()
+        date, timestamp = int(now.strftime("%Y%m%d")), now.strftime("%H%M")
+        started = time.perf_counter()
+        meter_ids, readings = self.collect()
+
+        with self.lock:
+            for i in range(0, len(meter_ids), self.batch_size):
+                self.pending.append((date, timestamp, meter_ids[i:i + self.batch_size], readings[i:i + self.batch_size]))
+            pending, self.pending = self.pending, []
+
+        batches = self.pack(pending)
+        failed = []
+        misdirected = 0
+        for batch in batches:
+            accepted = self.send(batch)   # None: refused for good (sent to a reader worker)
+            if accepted is None:
+                misdirected += batch["size"]
+            elif not accepted:
+                failed.extend(batch["entries"])
+
+        with self.lock:
+            self.pending = failed + self.pending
+            dropped = max(0, len(self.pending) - PUSH_BUFFER_LIMIT)
+            del self.pending[:dropped]
+
+        elapsed = time.perf_counter() - started
+        sent = sum(batch["size"] for batch in batches) - sum(len(entry[2]) for entry in failed) - misdirected
+        metrics.observe("push_cycle_seconds", elapsed)
+        metrics.inc("readings_pushed_total", sent)
+        metrics.set("push_pending_batches", len(self.pending))
+        if dropped:
+            metrics.inc("push_batches_dropped_total", dropped)
+        log_event("push_cycle", timestamp=timestamp, meters=len(meter_ids), requests=len(batches),
+                  sent=sent, pending=len(self.pending), dropped=dropped, misdirected=misdirected,
+                  seconds=round(elapsed, 4))
+        return {"meters": len(meter_ids), "requests": len(batches), "sent": sent,
+                "pending": len(self.pending), "seconds": round(elapsed, 4)}
+
+    def run(self):
+        while True:
+            now = time.time()
+            midnight = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+            next_push = midnight + ((now - midnight) // self.interval + 1) * self.interval
+            time.sleep(max(0, next_push - time.time()))
+            try:
+                self.push()
+            except Exception as e:
+                log_event("push_cycle_failed", error=str(e))
+
+
+gateway = None
+
+
+# push the current readings now instead of waiting for :00 / :30 (benchmark.py uses this)
+@app.route("/push_now", methods=["POST"])
+def push_now():
+    if gateway is None:
+        return jsonify({"message": "Push mode is off", "status": "error"}), 409
+    return jsonify({"status": "success", **gateway.push()})
+
+
+import argparse
 
 if __name__ == "__main__":
-    # 在后台线程中运行 run_meters()
-    threading.Thread(target=run_meters, daemon=True).start()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--simulate", action="store_true", help="keep all meters in memory (NumPy)")
+    parser.add_argument("--meters", type=int, default=0, help="synthetic fleet size for --simulate")
+    parser.add_argument("--no-push", action="store_true",
+                        help="do not push readings; store_readings must run with INGEST_MODE=pull")
+    parser.add_argument("--push-interval", type=float, default=PUSH_INTERVAL,
+                        help="seconds between pushes (default: every half hour)")
+    parser.add_argument("--batch-size", type=int, default=PUSH_BATCH_SIZE, help="readings per push request")
+    parser.add_argument("--ingest-url", default=STORE_INGEST_URL,
+                        help="store_readings POST /ingest (with reader workers: the ingest process, port 5003)")
+    args = parser.parse_args()
+
+    use_reloader = not args.simulate
+    # with the reloader this block also runs in the watching parent; only the serving child
+    # updates meters and pushes, otherwise every reading would be pushed twice
+    serving = not use_reloader or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+
+    if args.simulate:
+        start_simulation(args.meters)
+        threading.Thread(target=run_simulation, args=(args.meters,), daemon=True).start()
+    elif serving:
+        # 在后台线程中运行 run_meters()
+        threading.Thread(target=run_meters, daemon=True).start()
+
+    if not args.no_push:
+        gateway = PushGateway(args.ingest_url, batch_size=args.batch_size, interval=args.push_interval)
+        if serving:
+            threading.Thread(target=gateway.run, daemon=True).start()
 
     # 运行 Flask 服务器
-    app.run(port=5001, debug=True)
+    app.run(port=5001, debug=True, use_reloader=use_reloader)
     
     
 
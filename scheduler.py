@@ -0,0 +1,133 @@
+# v1
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics, log_event
+
+# Deadline scheduler for store_readings.py.
+#
+# Jobs run on fixed boundaries counted from local midnight (every 1800 s for the
+# half-hour fetch, every 86400 s for the rollover). The loop sleeps until the
+# next deadline instead of polling, and each job has its own single-thread
+# executor, so a slow fetch never holds up the midnight rollover.
+#
+# The last deadline each job ran for is kept in STATE_FILE. On start, a job
+# whose deadlines were missed while the process was down runs once for the
+# latest missed one (readings are cumulative, so one run catches up).
+
+STATE_FILE = "scheduler_state.json"
+MAX_SLEEP = 60    # seconds; re-check at least this often in case the wall clock jumps
+
+HALF_HOUR = 30 * 60
+DAY = 24 * 60 * 60
+
+
+def last_deadline(now, period):
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight + timedelta(seconds=(now - midnight).total_seconds() // period * period)
+
+
+class Job:
+    def __init__(self, name, func, period, last_run):
+        self.name = name
+        self.func = func          # func(deadline)
+        self.period = period
+        self.last_run = last_run  # deadline of the last run, datetime or None
+        self.next_run = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"job-{name}")
+        self.running = False
+
+
+class DeadlineScheduler:
+    def __init__(self, state_file=STATE_FILE):
+        self.state_file = state_file
+        self.jobs = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.state = self.load_state()
+
+    def load_state(self):
+        try:
+            with open(self.state_file) as f:
+                return {name: datetime.fromisoformat(when) for name, when in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self):
+        with self.lock:
+            state = {job.name: job.last_run.isoformat() for job in self.jobs if job.last_run is not None}
+            tmp_path = self.state_file + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, indent=1)
+            os.replace(tmp_path, self.state_file)
+
+    # since: deadline assumed already run when the state file has no entry (None: no catch-up)
+    def add_job(self, name, func, period, since=None):
+        self.jobs.append(Job(name, func, period, self.state.get(name, since)))
+
+    def every_half_hour(self, name, func, since=None):
+        self.add_job(name, func, HALF_HOUR, since)
+
+    def every_midnight(self, name, func, since=None):
+        self.add_job(name, func, DAY, since)
+
+    def catch_up(self, now):
+        for job in self.jobs:
+            latest = last_deadline(now, job.period)
+            if job.last_run is not None and job.last_run < latest:
+                missed = int((latest - job.last_run).total_seconds() // job.period)
+                log_event("job_catch_up", job=job.name, missed=missed, deadline=latest.isoformat())
+                metrics.inc("scheduler_missed_total", missed, job=job.name)
+                self.submit(job, latest, now)
+            job.next_run = latest + timedelta(seconds=job.period)
+
+    def submit(self, job, deadline, now):
+        with self.lock:
+            if job.running:
+                # the previous run is still going; skip rather than queue behind it
+                log_event("job_overrun", job=job.name, deadline=deadline.isoformat())
+                metrics.inc("scheduler_overruns_total", job=job.name)
+                return
+            job.running = True
+        metrics.observe("scheduler_lateness_seconds", max(0.0, (now - deadline).total_seconds()), job=job.name)
+        job.executor.submit(self.run_job, job, deadline)
+
+    def run_job(self, job, deadline):
+        try:
+            job.func(deadline)
+        except Exception as e:
+            metrics.inc("scheduler_job_errors_total", job=job.name)
+            log_event("job_failed", job=job.name, deadline=deadline.isoformat(), error=repr(e))
+        finally:
+            with self.lock:
+                job.running = False
+                job.last_run = max(job.last_run or deadline, deadline)
+            self.save_state()
+
+    def run(self):
+        self.catch_up(datetime.now())
+        while not self.stopped.is_set():
+            now = datetime.now()
+            # jobs due together start together on their own executors, in no set order;
+            # a job that depends on another one must wait for it itself
+            for job in self.jobs:
+                if job.next_run <= now:
+                    deadline = last_deadline(now, job.period)
+                    self.submit(job, deadline, now)
+                    job.next_run = deadline + timedelta(seconds=job.period)
+            wake_at = min(job.next_run for job in self.jobs)
+            self.stopped.wait(min(MAX_SLEEP, max(0.0, (wake_at - datetime.now()).total_seconds())))
+
+    def start(self):
+        if self.jobs and self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        for job in self.jobs:
+            job.executor.shutdown(wait=False)
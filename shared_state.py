@@ -0,0 +1,137 @@
+# v1
+import os
+import json
+import shutil
+import tempfile
+import threading
+import numpy as np
+from meter_store import TodayStore, DailyStore, PeriodBaselines
+
+# Shared state for multi-worker deployments of store_readings.
+#
+# The ingest process owns every write. After each change it publishes the
+# stores as .npy files in a RAM-backed directory (/dev/shm), one directory per
+# part and generation, then swaps manifest.json atomically. Read-only workers
+# map those files with np.load(mmap_mode="r"): all workers share the same
+# physical pages, and a worker remaps only when the manifest changes.
+
+SHARED_STATE_DIR = os.environ.get(
+    "STORE_SHARED_DIR",
+    "/dev/shm/electricity_store" if os.path.isdir("/dev/shm")
+    else os.path.join(tempfile.gettempdir(), "electricity_store"))
+MANIFEST = "manifest.json"
+KEEP_GENERATIONS = 3     # older generations are removed; readers may still map the last few
+PARTS = {"today": TodayStore, "daily": DailyStore, "baselines": PeriodBaselines}
+
+
+def to_json(value):
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+class SharedStatePublisher:
+    def __init__(self, directory=SHARED_STATE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.manifest = self.read_manifest()
+
+    def read_manifest(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"generation": 0, "parts": {}}
+
+    def _write_part(self, name, store, generation):
+        meta, arrays = store.export_state()
+        part_dir = os.path.join(self.directory, f"{name}.{generation}")
+        tmp_dir = part_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for array_name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{array_name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f, default=to_json)
+        os.replace(tmp_dir, part_dir)
+        return os.path.basename(part_dir)
+
+    # Publish any of today / daily / baselines; all of them become visible at once
+    def publish(self, **stores):
+        with self.lock:
+            generation = self.manifest["generation"] + 1
+            parts = dict(self.manifest["parts"])
+            for name, store in stores.items():
+                parts[name] = self._write_part(name, store, generation)
+
+            manifest = {"generation": generation, "parts": parts}
+            tmp_path = os.path.join(self.directory, MANIFEST + ".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, os.path.join(self.directory, MANIFEST))
+            self.manifest = manifest
+            self._remove_old(generation)
+
+    def _remove_old(self, generation):
+        in_use = set(self.manifest["parts"].values())
+        for entry in os.listdir(self.directory):
+            name, _, suffix = entry.partition(".")
+            if name in PARTS and suffix.isdigit() and entry not in in_use \
+                    and int(suffix) <= generation - KEEP_GENERATIONS:
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+
+class SharedStateReader:
+    def __init__(self, directory=SHARED_STATE_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.manifest_mtime = None
+        self.loaded = {}
+        self.stores = {"today": TodayStore(), "daily": DailyStore(), "baselines": PeriodBaselines()}
+
+    def _load_part(self, name, part):
+        part_dir = os.path.join(self.directory, part)
+        with open(os.path.join(part_dir, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {}
+        for entry in os.listdir(part_dir):
+            if entry.endswith(".npy"):
+                arrays[entry[:-4]] = np.load(os.path.join(part_dir, entry), mmap_mode="r")
+        return PARTS[name].import_state(meta, arrays)
+
+    # Remap whatever the ingest process has published since the last call.
+    # Costs one stat() when nothing changed.
+    def refresh(self):
+        manifest_path = os.path.join(self.directory, MANIFEST)
+        try:
+            stat = os.stat(manifest_path)
+        except FileNotFoundError:
+            return
+        mtime = (stat.st_ino, stat.st_mtime_ns)
+        if mtime == self.manifest_mtime:
+            return
+
+        with self.lock:
+            if mtime == self.manifest_mtime:
+                return
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+                stores = dict(self.stores)
+                for name, part in manifest["parts"].items():
+                    if self.loaded.get(name) != part:
+                        stores[name] = self._load_part(name, part)
+            except (OSError, ValueError):
+                # replaced mid-read by a newer generation: keep serving the old one, retry next call
+                return
+            self.stores = stores
+            self.loaded = dict(manifest["parts"])
+            self.manifest_mtime = mtime
+
+    def snapshot(self):
+        self.refresh()
+        stores = self.stores
+        return stores["today"], stores["daily"], stores["baselines"]
@@ -1,39 +1,122 @@
 # v2
 import os
+import glob
 import pandas as pd
+import numpy as np
 import json
 import csv
 import requests
 import time
 import threading
-import schedule
-import requests
+import logging
 from datetime import datetime, timedelta, time
 from flask import Flask, jsonify, request
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from http_client import client
+from today_csv import read_today_csv
+from today_file import TodayFileWriter, read_today_file
+from history_file import HistoryFile
+from codec import CompressedHistory
+from interval_store import IntervalStore, slot_usage
+from shared_state import SharedStatePublisher, SharedStateReader
+from ingest_shards import init_shard_worker, partition, fetch_shard
+from metrics import metrics, instrument, log_event
+from scheduler import DeadlineScheduler
+from wal import WriteAheadLog, write_checkpoint, read_checkpoint
+from meter_store import TodayStore, DailyStore, PeriodBaselines, SLOTS_PER_DAY, timestamp_to_slot, timestamps_to_slots, slot_to_timestamp, usage_figures
 
 USER_API_URL = "http://127.0.0.1:5000/meter_ids"
 METER_API_URL = "http://127.0.0.1:5001/get_meter_data/"
+METER_BULK_API_URL = "http://127.0.0.1:5001/get_meter_data_bulk"
 METER_DATA_FOLDER = "meter_data"
 USERS_DATA_FILE = "users.json"
-TODAY_CSV = "electricity_data_today.csv"
-DAILY_CSV = "electricity_data_daily.csv"
+TODAY_FILE = "electricity_data_today.elzt"   # compressed, one record per slot (today_file.py)
+TODAY_FILE_ROLLOVER = "electricity_data_today.rollover.elzt"   # closing day, kept until archived
+TODAY_FILE_UNARCHIVED = "electricity_data_today.rollover.{date}.elzt"   # a closing day whose archive failed
+TODAY_CSV = "electricity_data_today.csv"   # legacy format (and the demo data), migrated on start
+TODAY_WAL = "electricity_data_today.wal"             # every ingested batch, fsynced before it is applied (wal.py)
+TODAY_CHECKPOINT = "electricity_data_today.ckpt.npz" # today store as of a WAL sequence number
+DAILY_CSV = "electricity_data_daily.csv"          # legacy format, migrated on first start
+DAILY_HISTORY_BIN = "electricity_data_daily.bin"  # legacy uncompressed history (history_file.py), migrated too
+DAILY_HISTORY = "electricity_data_daily.elz"      # compressed history, see codec.py
+INTERVAL_FOLDER = "interval_data"                 # half-hourly history, one partition per day (interval_store.py)
+SCHEDULER_STATE = "scheduler_state.json"          # last deadline run per job, for catch-up after a restart
+
+FETCH_CHUNK_SIZE = 1000       # meters per bulk request
+FETCH_WORKERS = 8             # bulk requests in flight at once
+FETCH_TIME_BUDGET = 25 * 60   # seconds, leaves headroom inside the 30-minute window
+ROLLOVER_WAIT = 60            # seconds a midnight fetch waits for the rollover to open its day
+
+# push: meters / a gateway POST batches to /ingest (default)
+# pull: the scheduler polls mock_meter every half hour (fetch_meter_data)
+INGEST_MODE = os.environ.get("INGEST_MODE", "push")
+INGEST_FLUSH_DELAY = 5        # seconds; the batches of one push share a today-file row and a shared-state publish
+
+# Sharded ingestion (ingest_shards.py), pull mode only: 0 keeps the thread pool in this process
+INGEST_SHARDS = int(os.environ.get("INGEST_SHARDS", 0))
+SHARD_MERGE_WAIT = 5 * 60     # seconds; shards finishing later are merged on arrival
+
+CHECKPOINT_PERIOD = 10 * 60   # seconds between checkpoints; recovery replays at most this much WAL
+
+# Deployment role, see README.txt:
+#   standalone  one process does everything (python store_readings.py)
+#   ingest      owns the scheduler and every write, publishes to shared memory
+#   reader      read-only API worker (gunicorn), serves the published state
+STORE_ROLE = os.environ.get("STORE_ROLE", "standalone")
+INGEST_PORT = int(os.environ.get("STORE_INGEST_PORT", 5003))   # readers take 5002
+MISDIRECTED = 421   # a reader asked to write; 409 means "retry later" to the push gateway
+
+STATUS_WATCH_TIMEOUT = 30     # seconds a /api/server_status/watch long-poll waits for a change
 
 acceptAPI = True
 
-data_today = {}
-data_daily = {}
-server_running = True
+# data_today / data_daily are the snapshot served to readers.
+# ingest_today is where fetches write; it is the same object as data_today
+# except during a rollover, when it already holds the new day.
+# state_lock guards swapping these references and writing into ingest_today.
+data_today = TodayStore(int(datetime.now().strftime("%Y%m%d")))
+data_daily = DailyStore()
+data_baselines = PeriodBaselines()   # week / month / ... start readings, rebuilt at archive
+# (today, daily, baselines) as served by get_snapshot: replaced as a whole under
+# state_lock and read without it, so API reads never wait behind ingest or fsyncs
+snapshot = (data_today, data_daily, data_baselines)
+ingest_today = data_today
+daily_history = None   # CompressedHistory, opened by restore_daily
+interval_history = IntervalStore(INTERVAL_FOLDER)
+state_lock = threading.Lock()
+ingest_day_changed = threading.Condition(state_lock)   # notified when ingest_today moves to a new day
+rollover_lock = threading.Lock()   # one rollover at a time (scheduler, /stopserver)
+scheduler = None       # DeadlineScheduler, started by start_background_scheduler
+
+today_writer = TodayFileWriter(TODAY_FILE)
+today_wal = WriteAheadLog(TODAY_WAL) if STORE_ROLE != "reader" else None
+checkpoint_lock = threading.Lock()   # one checkpoint at a time; taken before state_lock
+checkpoint_seq = 0                   # WAL sequence number in the latest checkpoint
+shared_publisher = SharedStatePublisher() if STORE_ROLE == "ingest" else None
+shared_reader = SharedStateReader() if STORE_ROLE == "reader" else None
 
 app = Flask(__name__)
-executor = ThreadPoolExecutor(max_workers=5)
+instrument(app, "store_readings")
+executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS)
+shard_pool = None      # ProcessPoolExecutor, started on the first sharded fetch
+ingest_flush = None    # pending threading.Timer for pushed batches
+ingest_slots = set()   # slots pushed since the last flush
+
+# Server status pushed to app.py through the /api/server_status/watch long-poll:
+#   accepting  serving normally (from start until the first rollover)
+#   archiving  rollover running; readers still get the closing day
+#   ready      rollover done, the new day is being served
+server_status = {"state": "accepting", "version": 0, "date": data_today.date}
+status_changed = threading.Condition()
 
 
 
 # Retrieve registered meter_id
 
 def load_meter_ids():
-    response = requests.get(USER_API_URL)
+    response = client.get(USER_API_URL)
     meter_ids = response.json()
     return meter_ids
 
@@ -41,190 +124,516 @@ def load_meter_ids():
 # Read data every half hour
 
 
-# Read data into today dict
-def fetch_meter_data():
-
-    global data_today
-    meter_ids = load_meter_ids()
-    current_time = datetime.now().strftime("%H%M")
-    print(current_time)
-    print(meter_ids)
-
-    for meter_id in meter_ids:
-        response = requests.get(f"{METER_API_URL}{meter_id}")
-        reading = response.json().get("reading_kwh", None)
-        print(meter_id, reading)
-        if reading is not None:
-            if meter_id not in data_today:
-                data_today[meter_id] = {}
-            data_today[meter_id][current_time] = reading
-    save_today_data_to_csv(data_today)
-
-
-# Copy today dict to today CSV
-def save_today_data_to_csv(data_today, filename=TODAY_CSV):
-    current_date = datetime.now().strftime("%Y%m%d")
+# Read one chunk of meters with a single bulk request
+def fetch_meter_chunk(meter_ids, deadline):
+    timeout = max(1, deadline - time.monotonic())
+    response = client.post(METER_BULK_API_URL, json={"meter_ids": meter_ids}, timeout=timeout)
+    response.raise_for_status()
+    return response.json().get("readings", {})
 
-    df = pd.read_csv(filename)
 
-    latest_data = {}
-    for meter_id, readings in data_today.items():
-        if readings:
-            latest_timestamp = max(readings.keys())
-            latest_data[meter_id] = readings[latest_timestamp]
+# Read data into today dict; when is the half-hour deadline (datetime), default now
+def fetch_meter_data(when=None):
+    when = when or datetime.now()
+    if INGEST_SHARDS > 0:
+        return fetch_meter_data_sharded(when)
 
-    for meter_id in latest_data.keys():
-        if meter_id not in df.columns:
-            df[meter_id] = ""
+    started = time.perf_counter()
+    meter_ids = load_meter_ids()
+    current_time = when.strftime("%H%M")
+    date = int(when.strftime("%Y%m%d"))
+    deadline = time.monotonic() + FETCH_TIME_BUDGET
+
+    chunks = [meter_ids[i:i + FETCH_CHUNK_SIZE] for i in range(0, len(meter_ids), FETCH_CHUNK_SIZE)]
+    futures = [executor.submit(fetch_meter_chunk, chunk, deadline) for chunk in chunks]
+    done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+
+    # chunks still running when the budget runs out are dropped for this cycle
+    for future in not_done:
+        future.cancel()
+
+    received_ids = []
+    received_values = []
+    failed_chunks = len(not_done)
+    for future in done:
+        try:
+            readings = future.result()
+        except (requests.RequestException, ValueError) as e:
+            failed_chunks += 1
+            log_event("bulk_read_failed", error=str(e))
+            continue
+        for meter_id, reading in readings.items():
+            if reading is not None:
+                received_ids.append(meter_id)
+                received_values.append(reading)
+
+    with state_lock:
+        if ingest_today.date != date:
+            log_event("ingest_stale", date=date, meters=len(received_ids))
+            return   # the slot's day is not the ingest day (rollover still pending, or already done)
+        today_wal.append(date, timestamp_to_slot(current_time), received_ids, received_values)
+        ingest_today.set_readings(timestamp_to_slot(current_time), received_ids, received_values)
+        save_today_data_to_file(ingest_today)
+        # during a rollover readers stay on the closing day until publish_new_day
+        if ingest_today is data_today:
+            publish_shared(today=data_today)
+    record_ingest_cycle(current_time, len(received_ids), len(meter_ids), time.perf_counter() - started,
+                        chunks=len(chunks), failed_chunks=failed_chunks)
+
+
+def record_ingest_cycle(current_time, received, requested, seconds, **fields):
+    metrics.observe("ingest_cycle_seconds", seconds)
+    metrics.inc("meters_ingested_total", received)
+    metrics.set("ingest_last_meters", received)
+    metrics.set("ingest_last_missing", requested - received)
+    log_event("ingest_cycle", slot=current_time, meters=received, requested=requested,
+              seconds=round(seconds, 4), **fields)
+
+
+def get_shard_pool():
+    global shard_pool
+    if shard_pool is None:
+        # spawn: workers must not inherit this process's threads, locks or sockets
+        shard_pool = ProcessPoolExecutor(max_workers=INGEST_SHARDS, initializer=init_shard_worker,
+                                         mp_context=multiprocessing.get_context("spawn"))
+    return shard_pool
+
+
+# A worker died: start a fresh pool on the next tick
+def reset_shard_pool():
+    global shard_pool
+    pool, shard_pool = shard_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Merge shard results into the slot they were fetched for
+def merge_shards(date, slot, results):
+    received_ids = [meter_id for result in results for meter_id in result["meter_ids"]]
+    received_values = np.concatenate([result["values"] for result in results]) if results else []
+    with state_lock:
+        if ingest_today.date != date:
+            return False   # the day rolled over meanwhile; this slot belongs to the archived day
+        today_wal.append(date, slot, received_ids, received_values)
+        ingest_today.set_readings(slot, received_ids, received_values)
+        save_today_data_to_file(ingest_today)
+        if ingest_today is data_today:
+            publish_shared(today=data_today)
+    return True
+
+
+def record_shard_timing(result, late=False):
+    metrics.observe("ingest_shard_seconds", result["total_seconds"], shard=result["shard"])
+    if late:
+        metrics.inc("ingest_shards_late_total")
+    log_event("ingest_shard", shard=result["shard"], meters=len(result["meter_ids"]),
+              requested=result["requested"], fetch_seconds=round(result["fetch_seconds"], 4),
+              parse_seconds=round(result["parse_seconds"], 4), seconds=round(result["total_seconds"], 4),
+              chunks=result["chunks"], failed_chunks=result["failed_chunks"], late=late)
+
+
+# Each shard process fetches and parses its partition of the meter IDs; on-time
+# shards are merged together, a late shard is merged on its own when it finishes.
+def fetch_meter_data_sharded(when):
 
-    latest_df = pd.DataFrame([[current_date, latest_timestamp] + list(latest_data.values())], 
-                             columns=["date", "timestamp"] + list(latest_data.keys()))
+    meter_ids = load_meter_ids()
+    current_time = when.strftime("%H%M")
+    date, slot = int(when.strftime("%Y%m%d")), timestamp_to_slot(current_time)
+    started = time.time()
+    deadline = started + FETCH_TIME_BUDGET
+
+    pool = get_shard_pool()
+    futures = [pool.submit(fetch_shard, shard, METER_BULK_API_URL, shard_ids, FETCH_CHUNK_SIZE, deadline)
+               for shard, shard_ids in enumerate(partition(meter_ids, INGEST_SHARDS))]
+    done, not_done = wait(futures, timeout=min(SHARD_MERGE_WAIT, FETCH_TIME_BUDGET))
+
+    results = []
+    for future in done:
+        try:
+            results.append(future.result())
+        except BrokenProcessPool as e:
+            reset_shard_pool()
+            log_event("shard_failed", error=str(e))
+        except Exception as e:
+            log_event("shard_failed", error=str(e))
+    results.sort(key=lambda result: result["shard"])
+    merge_shards(date, slot, results)
+
+    received = sum(len(result["meter_ids"]) for result in results)
+    record_ingest_cycle(current_time, received, len(meter_ids), time.time() - started,
+                        shards=len(futures), shards_merged=len(results), shards_late=len(not_done))
+    for result in results:
+        record_shard_timing(result)
+
+    def merge_late(future):
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            reset_shard_pool()
+            log_event("shard_failed", error=str(e), late=True)
+            return
+        except Exception as e:
+            log_event("shard_failed", error=str(e), late=True)
+            return
+        merged = merge_shards(date, slot, [result])
+        record_shard_timing(result, late=True)
+        if not merged:
+            log_event("shard_dropped", shard=result["shard"], date=date, reason="day rolled over")
 
-    df = pd.concat([df, latest_df], ignore_index=True)
+    for future in not_done:
+        future.add_done_callback(merge_late)
 
-    df.to_csv(filename, index=False)
-    print(f"Latest data appended to {filename}")
 
+# Latest (today, daily, baselines), consistent with each other
+def get_snapshot():
+    if shared_reader is not None:
+        return shared_reader.snapshot()
+    return snapshot
+
+
+# Make the current stores visible to reader workers (ingest role only)
+def publish_shared(**stores):
+    if shared_publisher is None:
+        return
+    with metrics.timer("shared_publish_seconds") as timer:
+        shared_publisher.publish(**stores)
+    log_event("shared_state_published", parts=list(stores), seconds=round(timer.seconds, 4))
+
+
+# Append the latest readings of today dict to the today file
+def save_today_data_to_file(data_today, writer=None):
+    writer = writer or today_writer
+    current_date = data_today.date
+
+    if data_today.last_slot < 0:
+        return
+
+    meter_ids, slots, values = data_today.latest_all()
+    latest_timestamp = slot_to_timestamp(data_today.last_slot)
+    latest_data = {meter_id: float(value) for meter_id, slot, value in zip(meter_ids, slots, values) if slot >= 0}
+
+    with metrics.timer("today_file_append_seconds"):
+        writer.append(current_date, latest_timestamp, latest_data)
+
+
+
+
+
+# Store the closing day's last readings into the daily store
+def archive_to_data_daily(closing_day, daily):
+
+    with metrics.timer("archive_seconds", target="daily_store") as timer:
+        meter_ids, slots, values = closing_day.latest_all()  # last slot = 2330
+        has_reading = slots >= 0
+        daily.set_day(closing_day.date, [m for m, ok in zip(meter_ids, has_reading) if ok], values[has_reading])
+
+    log_event("archived", target="daily_store", date=closing_day.date, meters=int(has_reading.sum()),
+              seconds=round(timer.seconds, 4))
+
+
+# Store the closing day's last readings into the daily history file
+def archive_to_history_file(closing_day):
 
+    with metrics.timer("archive_seconds", target="history_file") as timer:
+        meter_ids, slots, values = closing_day.latest_all()  # last slot = 2330
+        has_reading = slots >= 0
+        daily_history.write_day(closing_day.date, [m for m, ok in zip(meter_ids, has_reading) if ok],
+                                values[has_reading])
 
+    log_event("archived", target="history_file", file=DAILY_HISTORY, date=closing_day.date,
+              meters=int(has_reading.sum()), seconds=round(timer.seconds, 4))
 
 
-# Store today’s dict into the daily dict
-def archive_to_data_daily():
-    global data_today, data_daily
+# Store the closing day's 48 half-hourly readings as its interval partition
+def archive_to_interval_history(closing_day):
 
-#    previous_date = int((datetime.now() - timedelta(days=1)).strftime("%Y%m%d"))
-    previous_date = int((datetime.now()).strftime("%Y%m%d"))
+    with metrics.timer("archive_seconds", target="interval_history") as timer:
+        meter_ids, opening, readings = closing_day.interval_arrays()
+        size = interval_history.archive_day(closing_day.date, meter_ids, opening, readings,
+                                            daily_total=round(float(closing_day.daily_total), 4),
+                                            peak_slot=int(closing_day.peak_slot),
+                                            peak_load=round(float(closing_day.peak_load), 4))
 
-    for meter_id, readings in data_today.items():
-        if readings:
-            last_timestamp = max(readings.keys())  # last_timestamp = 2330
-            last_reading = readings[last_timestamp]
-            
-            if meter_id not in data_daily:
-                data_daily[meter_id] = {}
-            
-            data_daily[meter_id][previous_date] = last_reading
+    log_event("archived", target="interval_history", folder=INTERVAL_FOLDER, date=closing_day.date,
+              meters=len(meter_ids), bytes=size, seconds=round(timer.seconds, 4))
 
-    print("Daily data archived:", data_daily)
 
+# Start a new day for ingest; readers keep the old snapshot.
+# The closing day's today file is set aside until the archive has been written.
+def start_new_day(new_date):
+    global ingest_today
+    with state_lock:
+        flush_ingest_locked()   # pushed readings of the closing day go into its today file
+        closing_day = ingest_today
+        ingest_today = TodayStore(new_date)
+        meter_ids, slots, values = closing_day.latest_all()
+        ingest_today.set_opening(meter_ids, values)
+        today_writer.close()
+        if os.path.exists(TODAY_FILE):
+            os.replace(TODAY_FILE, TODAY_FILE_ROLLOVER)
+        today_writer.reset()
+        ingest_day_changed.notify_all()
+    checkpoint_today(force=True)   # the closing day's WAL is not needed once the new day is checkpointed
+    log_event("ingest_switched", date=new_date, closing_date=closing_day.date)
+    return closing_day
 
-# Store daily dict into the daily csv
-def archive_to_csv_daily():
-    global data_today, data_daily
 
-#    previous_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-    previous_date = (datetime.now().strftime("%Y%m%d"))
+# Save the ingest store with the WAL position it includes, then drop the WAL
+# before that position. The arrays are copied under state_lock and written after.
+def checkpoint_today(deadline=None, force=False):
+    global checkpoint_seq
+    with checkpoint_lock:
+        with state_lock:
+            if not force and today_wal.seq == checkpoint_seq and os.path.exists(TODAY_CHECKPOINT):
+                return
+            flush_ingest_locked()   # the today file must hold everything the WAL is about to forget
+            meta, arrays = ingest_today.export_state()
+            arrays = {name: np.array(array) for name, array in arrays.items()}
+            seq = today_wal.seq
+            today_wal.rotate()
 
-    if os.path.exists(DAILY_CSV):
-        df = pd.read_csv(DAILY_CSV)
-    else:
-        df = pd.DataFrame(columns=["date"])
+        with metrics.timer("checkpoint_seconds") as timer:
+            size = write_checkpoint(TODAY_CHECKPOINT, meta, arrays, seq)
+            today_wal.drop_rotated()
+        checkpoint_seq = seq
+    log_event("checkpoint", date=meta["date"], seq=seq, meters=len(arrays["meter_ids"]), bytes=size,
+              seconds=round(timer.seconds, 4))
 
-    readings_2330 = {}
-    for meter_id, readings in data_today.items():
-        if readings:
-            last_timestamp = max(readings.keys())  # last_timestamp = 2330
-            last_reading = readings[last_timestamp]  
-            readings_2330[meter_id] = last_reading  
 
-            if meter_id not in data_daily:
-                data_daily[meter_id] = {}
-            data_daily[meter_id][int(previous_date)] = last_reading
+# Swap the readers over to the new day in one step
+def publish_new_day(new_daily, new_baselines):
+    global data_today, data_daily, data_baselines, snapshot, acceptAPI
+    with state_lock:
+        acceptAPI = False
+        started = time.perf_counter()
+        data_today = ingest_today
+        data_daily = new_daily
+        data_baselines = new_baselines
+        snapshot = (data_today, data_daily, data_baselines)
+        acceptAPI = True
+        busy = time.perf_counter() - started
+        publish_shared(today=data_today, daily=data_daily, baselines=data_baselines)
+    metrics.observe("busy_window_seconds", busy)
+    log_event("new_day_published", date=data_today.date, busy_us=round(busy * 1e6, 1))
 
-    for meter_id in readings_2330.keys():
-        if meter_id not in df.columns:
-            df[meter_id] = ""
 
-    if previous_date in df["date"].values:
-        df.loc[df["date"] == previous_date, readings_2330.keys()] = list(readings_2330.values())
+
+
+def set_server_status(state, date=None):
+    global server_status
+    with status_changed:
+        server_status = {"state": state, "version": server_status["version"] + 1,
+                         "date": date if date is not None else server_status["date"]}
+        status_changed.notify_all()
+    log_event("server_status", **server_status)
+
+
+def current_server_status():
+    return {**server_status, "acceptAPI": acceptAPI}
+
+
+# Restore data to dic from the today file (if needed)
+
+# Both restores decode the file in one vectorized pass and fill the store
+# arrays directly; rows for the same slot / date keep their last non-empty value.
+
+def load_today_file(filename):
+
+    df = read_today_file(filename)
+
+    date = int(df["date"].iloc[-1]) if len(df) else int(datetime.now().strftime("%Y%m%d"))
+    meter_ids = [str(meter_id) for meter_id in df.columns[2:]]
+
+    readings = df.iloc[:, 2:].astype(float)
+    readings.index = timestamps_to_slots(df["timestamp"])
+    readings = readings.groupby(level=0).last()
+
+    matrix = np.full((len(meter_ids), SLOTS_PER_DAY), np.nan)
+    matrix[:, readings.index.to_numpy()] = readings.to_numpy().T
+    opening = data_daily.readings_before(date)
+    return TodayStore.from_arrays(date, meter_ids, matrix, opening), len(df)
+
+
+# Same switch as start_new_day, while replaying the WAL at restore
+def replay_new_day(new_date):
+    global ingest_today
+    closing_day = ingest_today
+    if ingest_slots:
+        rollover_writer = TodayFileWriter(TODAY_FILE_ROLLOVER)
+        append_slots_to_file(closing_day, sorted(ingest_slots), rollover_writer)
+        rollover_writer.close()
+        ingest_slots.clear()
+    ingest_today = TodayStore(new_date)
+    meter_ids, slots, values = closing_day.latest_all()
+    ingest_today.set_opening(meter_ids, values)
+    log_event("wal_new_day", date=new_date, closing_date=closing_day.date)
+
+
+# Latest checkpoint plus the WAL written after it; the today file only when
+# there is no checkpoint yet. Replayed slots are written to the today file as well.
+def restore_today():
+    global data_today, ingest_today, checkpoint_seq
+
+    started = time.perf_counter()
+    checkpoint = read_checkpoint(TODAY_CHECKPOINT)
+    if checkpoint is not None:
+        meta, arrays, checkpoint_seq = checkpoint
+        data_today = TodayStore.import_state(meta, arrays)
+        source = f"{TODAY_CHECKPOINT} (WAL seq {checkpoint_seq})"
+    elif os.path.exists(TODAY_FILE):
+        data_today, n_rows = load_today_file(TODAY_FILE)
+        source = f"{TODAY_FILE} ({n_rows} rows)"
     else:
-        new_row = {"date": previous_date, **readings_2330}
-        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-
-    df.to_csv(DAILY_CSV, index=False)
-
-    print(f"Daily data archived and saved to {DAILY_CSV}")
-
-
-# Clear today’s dic & today’s CSV
-def clear_data_today():
-    global data_today
-    data_today.clear()
-    print("data_today.dic has been cleared.")
-
-    with open(TODAY_CSV, "w") as f:
-        f.write("date,timestamp\n")
-    print("electricity_data_today.csv has been cleared, only headers remain.")
-
-
-
-
-# Restore data to dic from csv (if needed)
+        date = int(datetime.now().strftime("%Y%m%d"))
+        data_today = TodayStore.from_arrays(date, [], np.empty((0, SLOTS_PER_DAY)), data_daily.readings_before(date))
+        source = "nothing (no today file yet)"
+    ingest_today = data_today
+
+    replayed = skipped = 0
+    for seq, date, slot, meter_ids, values in today_wal.replay(checkpoint_seq):
+        if date < ingest_today.date:
+            skipped += 1   # a day that is already closed
+            continue
+        if date > ingest_today.date:
+            # crashed between start_new_day and its checkpoint: open the new day here as well;
+            # the closing day is archived from its rollover file by recover_rollover
+            replay_new_day(date)
+        ingest_today.set_readings(slot, meter_ids, values)
+        ingest_slots.add(slot)
+        replayed += 1
+    data_today = ingest_today
+    today_wal.open(checkpoint_seq)
+    with state_lock:
+        flush_ingest_locked()
+    elapsed = time.perf_counter() - started
+
+    print(f" Data restored from {source} to data_today: {len(data_today)} meters, "
+          f"{replayed} WAL batches replayed ({skipped} for another day skipped) in {elapsed:.3f}s")
+    checkpoint_today()   # next start skips the today file / this WAL tail
+
+# Today CSVs of the old format (the live one, rollovers, demo data) become today
+# files of the same name; the CSV goes once its rows are in the new file
+def migrate_today_csv():
+    for csv_name in sorted(glob.glob("electricity_data_today*.csv")):
+        target = csv_name[:-len(".csv")] + ".elzt"
+        if os.path.exists(target):
+            continue
+        df = read_today_csv(csv_name)
+        writer = TodayFileWriter(target)
+        writer.reset()
+        meter_ids = [str(meter_id) for meter_id in df.columns[2:]]
+        for date, timestamp, values in zip(df["date"], df["timestamp"], df.iloc[:, 2:].to_numpy()):
+            present = ~np.isnan(values)
+            writer.append(int(date), int(timestamp),
+                          {meter_id: float(value) for meter_id, value, ok in zip(meter_ids, values, present) if ok})
+        writer.close()
+        os.remove(csv_name)
+        print(f" Migrated {csv_name} to {target} ({len(df)} rows)")
+
+
+def open_daily_history():
+    global daily_history
+
+    if daily_history is None:
+        if not os.path.exists(DAILY_HISTORY) and os.path.exists(DAILY_HISTORY_BIN):
+            legacy = HistoryFile(DAILY_HISTORY_BIN)
+            CompressedHistory.from_arrays(DAILY_HISTORY, *legacy.to_arrays()).close()
+            legacy.close()
+            print(f" Migrated {DAILY_HISTORY_BIN} to {DAILY_HISTORY}")
+        if not os.path.exists(DAILY_HISTORY) and os.path.exists(DAILY_CSV):
+            CompressedHistory.from_csv(DAILY_CSV, DAILY_HISTORY).close()
+            print(f" Migrated {DAILY_CSV} to {DAILY_HISTORY}")
+        if os.path.exists(DAILY_HISTORY):
+            daily_history = CompressedHistory(DAILY_HISTORY, writable=True)
+        else:
+            daily_history = CompressedHistory.create(DAILY_HISTORY, 0)
+    return daily_history
 
-def restore_today():
-    global data_today
 
-    df = pd.read_csv(TODAY_CSV, dtype={"timestamp": str})
+def restore_daily():
+    global data_daily
 
-    data_today = {}
+    started = time.perf_counter()
+    meter_ids, dates, readings = open_daily_history().to_arrays()
+    data_daily = DailyStore.from_arrays(meter_ids, dates, readings)
+    elapsed = time.perf_counter() - started
 
-    for _, row in df.iterrows():
-        timestamp = str(row["timestamp"])
-        for meter_id in df.columns[2:]:
-            if pd.notna(row[meter_id]):
-                if meter_id not in data_today:
-                    data_today[meter_id] = {}
-                data_today[meter_id][timestamp] = float(row[meter_id])
+    print(f" Data restored from {DAILY_HISTORY} to data_daily: {len(dates)} days x {len(meter_ids)} meters "
+          f"in {elapsed:.3f}s ({len(dates) / max(elapsed, 1e-9):.0f} rows/s, "
+          f"{readings.size / max(elapsed, 1e-9):.0f} readings/s)")
 
-    print(" Data restored from electricity_data_today.csv to data_today")
 
-def restore_daily():
+# Finish a rollover that was interrupted before its archive was written
+# Finish rollovers whose archive failed too (kept as TODAY_FILE_UNARCHIVED), oldest first
+def recover_rollover():
     global data_daily
-    data_daily = {}
+    pending = sorted(glob.glob(TODAY_FILE_UNARCHIVED.format(date="[0-9]" * 8)))
+    if os.path.exists(TODAY_FILE_ROLLOVER):
+        pending.append(TODAY_FILE_ROLLOVER)
+    for filename in pending:
+        closing_day, _ = load_today_file(filename)
+        archive_to_data_daily(closing_day, data_daily)
+        archive_to_history_file(closing_day)
+        archive_to_interval_history(closing_day)
+        os.remove(filename)
+        print(f" Interrupted rollover of {closing_day.date} archived")
 
-    with open(DAILY_CSV, "r", newline="", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        header = next(reader)
 
-        for row in reader:
-            date = int(row[0].replace("-", ""))
-            
-            for i, meter_id in enumerate(header[1:], start=1):
-                if row[i].strip():
-                    if meter_id not in data_daily:
-                        data_daily[meter_id] = {}
-                    data_daily[meter_id][date] = float(row[i])
-
-    print(" Data restored from electricity_data_daily.csv to data_daily")
+def restore_baselines():
+    global data_baselines, snapshot
+    data_baselines = PeriodBaselines.build(data_daily, data_today.date)
+    with state_lock:
+        snapshot = (data_today, data_daily, data_baselines)
+    print(f" Period baselines materialized for {data_today.date}: {data_baselines.boundaries}")
 
 
 
 # Schedule tasks
 import time
 
+# Half-hour fetches (pull mode) and one rollover at midnight, see scheduler.py.
+# Deadlines missed while the process was down are caught up on start.
 def start_scheduler():
+    global scheduler
+    scheduler = DeadlineScheduler(SCHEDULER_STATE)
+    # the day held in memory started at its midnight; any later midnight is a missed rollover
+    scheduler.every_midnight("rollover", scheduled_rollover,
+                             since=datetime.strptime(str(ingest_today.date), "%Y%m%d"))
+    if INGEST_MODE == "pull":
+        scheduler.every_half_hour("fetch", scheduled_fetch)
+    scheduler.add_job("checkpoint", checkpoint_today, CHECKPOINT_PERIOD)
+    return scheduler.start()
 
-    schedule.every().hour.at(":00").do(fetch_meter_data)
-    schedule.every().hour.at(":30").do(fetch_meter_data)
-    schedule.every().hour.at("00:00").do(stop_server)
 
+def start_background_scheduler():
+    return start_scheduler()
 
-   
-    # If testing is needed, you can change the number to the upcoming minute:
 
-#    schedule.every().hour.at(":00").do(fetch_meter_data)
-#    schedule.every().hour.at(":01").do(fetch_meter_data)
-#    schedule.every().hour.at(":01").do(archive_to_data_daily)
-#    schedule.every().hour.at(":01").do(archive_to_csv_daily)
+# Roll over to new_date unless ingest already holds that day (or a later one); the
+# closing day is whatever ingest holds. False when there was nothing to do.
+def rollover_to(new_date):
+    with rollover_lock:
+        if new_date <= ingest_today.date:
+            log_event("rollover_skipped", date=new_date, ingest_date=ingest_today.date)
+            return False
+        batchJobs(new_date)
+        return True
+
+
+# The rollover due at a midnight opens that midnight's day
+def scheduled_rollover(deadline):
+    rollover_to(int(deadline.strftime("%Y%m%d")))
 
-    while server_running:
-        schedule.run_pending()
-        time.sleep(10)  
-def start_background_scheduler():
 
-    scheduler_thread = threading.Thread(target=start_scheduler, daemon=True)
-    scheduler_thread.start()
+# The rollover job runs on its own executor: a fetch due at the same midnight
+# (or caught up with it) waits for the new day, or its slot would be dropped as stale
+def scheduled_fetch(deadline):
+    date = int(deadline.strftime("%Y%m%d"))
+    with state_lock:
+        opened = ingest_day_changed.wait_for(lambda: ingest_today.date >= date, timeout=ROLLOVER_WAIT)
+    if not opened:
+        log_event("fetch_waited_for_rollover", date=date, ingest_date=ingest_today.date, seconds=ROLLOVER_WAIT)
+    fetch_meter_data(deadline)
 
 #
 # API for querying today’s data
@@ -233,13 +642,16 @@ def start_background_scheduler():
 def get_today_data(meter_id):
     global acceptAPI
     if acceptAPI:
-        if meter_id in data_today:
-            latest_timestamp = max(data_today[meter_id].keys())  
-            latest_reading = data_today[meter_id][latest_timestamp] 
+        today, _, _ = get_snapshot()
+        latest = today.latest(meter_id)
+        if latest is not None:
+            latest_slot, latest_reading = latest
             return jsonify({
                 "meter_id": meter_id,
-                "timestamp": latest_timestamp,
-                "latest_reading": latest_reading
+                "date": today.date,
+                "timestamp": slot_to_timestamp(latest_slot),
+                "latest_reading": latest_reading,
+                "previous_reading": today.reading_before(meter_id, latest_slot)   # None: use the opening
             })
         else:
             return jsonify({
@@ -249,8 +661,9 @@ def get_today_data(meter_id):
     else:
         return jsonify({
             "meter_id": meter_id,
+            "acceptAPI": False,
             "message": "Server is busy."
-        }), 404
+        }), 503
 
 
 # API for querying daily data
@@ -270,11 +683,13 @@ def get_daily_data(meter_id):
         except ValueError:
             return jsonify({"error": "Invalid date format. Use YYYYMMDD"}), 400  
 
-        if meter_id in data_daily and query_date in data_daily[meter_id]:
+        _, daily, _ = get_snapshot()
+        reading = daily.get_reading(meter_id, query_date)
+        if reading is not None:
             return jsonify({
                 "meter_id": meter_id,
                 "date": query_date,
-                "reading": data_daily[meter_id][query_date]
+                "reading": reading
             })
         else:
             return jsonify({
@@ -289,6 +704,189 @@ def get_daily_data(meter_id):
             "message": "Server is busy."
         }), 404
 
+# API for daily readings over a date range, one meter or many
+
+def parse_date_range():
+    start = request.args.get("start")
+    end = request.args.get("end")
+    if not start or not end:
+        return None, (jsonify({"error": "Missing required parameters: start, end"}), 400)
+    try:
+        start, end = int(start), int(end)
+    except ValueError:
+        return None, (jsonify({"error": "Invalid date format. Use YYYYMMDD"}), 400)
+    if start > end:
+        return None, (jsonify({"error": "start must not be after end"}), 400)
+    return (start, end), None
+
+
+def to_json_list(values):
+    return [None if np.isnan(value) else round(float(value), 4) for value in values]
+
+
+@app.route("/get_daily_range/<meter_id>", methods=["GET"])
+def get_daily_range(meter_id):
+    if not acceptAPI:
+        return jsonify({"meter_id": meter_id, "message": "Server is busy."}), 503
+
+    date_range, error = parse_date_range()
+    if error:
+        return error
+    start, end = date_range
+
+    _, daily, _ = get_snapshot()
+    if meter_id not in daily:
+        return jsonify({
+            "meter_id": meter_id,
+            "message": "No data found for this meter_id."
+        }), 404
+
+    dates, readings, deltas = daily.range([meter_id], start, end)
+    return jsonify({
+        "meter_id": meter_id,
+        "start": start,
+        "end": end,
+        "dates": dates.tolist(),
+        "readings": to_json_list(readings[0]),
+        "deltas": to_json_list(deltas[0])
+    })
+
+
+# ?meter_ids=100000001,100000002&start=&end=
+@app.route("/get_daily_range", methods=["GET"])
+def get_daily_range_multi():
+    if not acceptAPI:
+        return jsonify({"message": "Server is busy."}), 503
+
+    date_range, error = parse_date_range()
+    if error:
+        return error
+    start, end = date_range
+
+    meter_ids = [meter_id for meter_id in request.args.get("meter_ids", "").split(",") if meter_id]
+    if not meter_ids:
+        return jsonify({"error": "Missing required parameter: meter_ids"}), 400
+
+    _, daily, _ = get_snapshot()
+    dates, readings, deltas = daily.range(meter_ids, start, end)
+    return jsonify({
+        "start": start,
+        "end": end,
+        "dates": dates.tolist(),
+        "meters": {
+            meter_id: {"readings": to_json_list(readings[i]), "deltas": to_json_list(deltas[i])}
+            for i, meter_id in enumerate(meter_ids)
+        }
+    })
+
+
+# API for a meter's half-hourly readings on one day: today from memory,
+# earlier days from their interval partition (loaded on first use, LRU cached)
+
+@app.route("/get_interval_data/<meter_id>", methods=["GET"])
+def get_interval_data(meter_id):
+    if not acceptAPI:
+        return jsonify({"meter_id": meter_id, "message": "Server is busy."}), 503
+
+    today, _, _ = get_snapshot()
+    try:
+        query_date = int(request.args.get("date", today.date))
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYYMMDD"}), 400
+
+    if query_date == today.date:
+        row = today.interval_row(meter_id)
+    else:
+        with metrics.timer("interval_lookup_seconds"):
+            row = interval_history.get(meter_id, query_date)
+        stats = interval_history.stats()
+        metrics.set("interval_cache_bytes", stats["cached_bytes"])
+        metrics.set("interval_cache_days", stats["days_cached"])
+        metrics.set("interval_cache_hits", stats["hits"])
+        metrics.set("interval_cache_misses", stats["misses"])
+
+    if row is None:
+        return jsonify({
+            "meter_id": meter_id,
+            "date": query_date,
+            "message": "No data found for this meter_id on this date."
+        }), 404
+
+    opening, readings = row
+    usage = slot_usage(opening, readings)
+    return jsonify({
+        "meter_id": meter_id,
+        "date": query_date,
+        "timestamps": [slot_to_timestamp(slot) for slot in range(SLOTS_PER_DAY)],
+        "opening_reading": None if np.isnan(opening) else round(opening, 4),
+        "readings": to_json_list(readings),
+        "usage": to_json_list(usage),
+        "daily_usage": round(float(np.nansum(usage)), 4)
+    })
+
+
+@app.route("/api/interval_history", methods=["GET"])
+def get_interval_history():
+    return jsonify({"dates": interval_history.dates(), **interval_history.stats()})
+
+
+# API for a meter's usage summary: every figure of the user usage page in one call
+
+@app.route("/get_usage_summary/<meter_id>", methods=["GET"])
+def get_usage_summary(meter_id):
+    if not acceptAPI:
+        return jsonify({
+            "meter_id": meter_id,
+            "acceptAPI": False,
+            "message": "Server is busy."
+        }), 503
+
+    today, daily, baselines = get_snapshot()
+    latest = today.latest(meter_id)
+    if latest is None:
+        return jsonify({
+            "meter_id": meter_id,
+            "error": "No today data found for this meter_id"
+        }), 404
+
+    latest_slot, current_reading = latest
+    previous_reading = today.reading_before(meter_id, latest_slot)
+    return jsonify({
+        "meter_id": meter_id,
+        "acceptAPI": True,
+        "timestamp": slot_to_timestamp(latest_slot),
+        **usage_figures(current_reading, previous_reading, baselines.get(meter_id))
+    })
+
+
+# API for a meter's period baselines (reading at the start of each period)
+
+@app.route("/get_baselines/<meter_id>", methods=["GET"])
+def get_baselines(meter_id):
+    _, _, baselines = get_snapshot()
+    return jsonify({
+        "meter_id": meter_id,
+        "date": baselines.date,
+        "boundaries": baselines.boundaries,
+        "readings": baselines.get(meter_id)
+    })
+
+# API for fleet-wide figures (administrator): kept up to date at ingest, so O(1) here
+
+@app.route("/api/fleet_summary", methods=["GET"])
+def get_fleet_summary():
+    today, _, _ = get_snapshot()
+    peak_slot = today.peak_slot
+    return jsonify({
+        "date": today.date,
+        "meters": today.reporting,
+        "daily_total_kwh": round(today.daily_total, 4),
+        "peak_timestamp": slot_to_timestamp(peak_slot) if peak_slot >= 0 else None,
+        "peak_load_kwh": round(today.peak_load, 4),
+        "slot_totals_kwh": {slot_to_timestamp(slot): round(float(load), 4)
+                            for slot, load in enumerate(today.slot_totals[:today.last_slot + 1])}
+    })
+
 # creat test data 
 import random
 
@@ -310,6 +908,7 @@ def create_test_data():
     with open(DAILY_CSV, "w", newline="") as f:
         writer = csv.writer(f)
         writer.writerows(daily_data)
+    CompressedHistory.from_csv(DAILY_CSV, DAILY_HISTORY).close()
     
     from datetime import time
     # generate today's data
@@ -353,51 +952,216 @@ def create_test_data():
 
 # batch jobs 
 
-def batchJobs():
-
-    print("Running batch jobs...\n")
-
-    thread1 = threading.Thread(target=archive_to_csv_daily)
-    thread2 = threading.Thread(target=archive_to_data_daily)
-    print("data of the past day:\n")
-    print(data_daily)
-    print(data_today)
-    clear_data_today()
-    print("\ndata of the past cleared\n")
-    print("data of today\n")
-    print(data_daily)
-    print(data_today)
-    thread1.start()
-    thread2.start()
-    
-    thread1.join()
-    thread2.join()
+def batchJobs(new_date=None):
+
+    log_event("rollover_started")
+    set_server_status("archiving")
+    started = time.perf_counter()
+
+    closing_day = start_new_day(new_date or int(datetime.now().strftime("%Y%m%d")))
+
+    # build the next daily snapshot off to the side while readers use the old one
+    new_daily = data_daily.fork()
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="archive") as archive_pool:
+        archives = {
+            "history_file": archive_pool.submit(archive_to_history_file, closing_day),
+            "daily_store": archive_pool.submit(archive_to_data_daily, closing_day, new_daily),
+            "interval_history": archive_pool.submit(archive_to_interval_history, closing_day),
+        }
+    failed = []
+    for target, future in archives.items():
+        try:
+            future.result()
+        except Exception as e:
+            failed.append(target)
+            metrics.inc("archive_errors_total", target=target)
+            log_event("archive_failed", level=logging.ERROR, target=target, date=closing_day.date, error=repr(e))
+
+    # readers move on either way; the closing day's file stays until a restart can archive it again
+    new_baselines = PeriodBaselines.build(new_daily, ingest_today.date)
+    publish_new_day(new_daily, new_baselines)
+    if os.path.exists(TODAY_FILE_ROLLOVER):
+        if failed:
+            os.replace(TODAY_FILE_ROLLOVER, TODAY_FILE_UNARCHIVED.format(date=closing_day.date))
+        else:
+            os.remove(TODAY_FILE_ROLLOVER)
+    elapsed = time.perf_counter() - started
+    set_server_status("ready", data_today.date)
+    metrics.observe("rollover_seconds", elapsed)
+    log_event("rollover_completed", meters=len(data_today), days=data_daily.n_days, seconds=round(elapsed, 4),
+              failed=failed)
 
 # stop server
 
 
 @app.route("/stopserver", methods=["GET"])
 def stop_server():
-    global acceptAPI
-    acceptAPI = False
-    batchJobs()
-    time.sleep(8) # time for demonstrating the stopserver page
-    acceptAPI = True
-    return jsonify({"message": "Server is stopping", "status": "success"})
+    if STORE_ROLE == "reader":
+        return jsonify({"message": f"Rollover runs in the ingest process (port {INGEST_PORT})",
+                        "status": "error"}), MISDIRECTED
+    # a second call on the same day would split it and overwrite its interval partition
+    if not rollover_to(int(datetime.now().strftime("%Y%m%d"))):
+        return jsonify({"message": f"Day {ingest_today.date} is already open; nothing to roll over",
+                        "status": "error"}), 409
+    return jsonify({"message": "Daily rollover completed", "status": "success"})
+
+
+# Batched push ingest: many meters and many slots per request.
+#
+#   POST /ingest
+#   {"date": 20250301,                       optional, defaults to the ingest day
+#    "slots": [{"timestamp": "0930", "meter_ids": ["100000001", ...], "readings": [123.4, ...]},
+#              ...]}
+#
+# Readings for a day that is already archived are dropped (and counted); a
+# date after the ingest day gets 409 so the sender keeps it and retries.
+# Reader workers answer 421: the sender is pointed at the wrong process.
+
+def parse_ingest_slots(body):
+    slots = body.get("slots") if isinstance(body, dict) else None
+    if not isinstance(slots, list) or not slots:
+        raise ValueError("Missing required field: slots")
+    parsed = []
+    for entry in slots:
+        meter_ids = entry.get("meter_ids")
+        readings = entry.get("readings")
+        if not isinstance(meter_ids, list) or not isinstance(readings, list) or len(meter_ids) != len(readings):
+            raise ValueError("Each slot needs meter_ids and readings of equal length")
+        slot = timestamp_to_slot(entry.get("timestamp"))
+        if not 0 <= slot < SLOTS_PER_DAY:
+            raise ValueError(f"Invalid timestamp: {entry.get('timestamp')}")
+        values = np.array([np.nan if value is None else value for value in readings], dtype=np.float64)
+        parsed.append((slot, [str(meter_id) for meter_id in meter_ids], values))
+    return parsed
+
+
+# Called with state_lock held
+def schedule_ingest_flush():
+    global ingest_flush
+    if ingest_flush is None:
+        ingest_flush = threading.Timer(INGEST_FLUSH_DELAY, flush_ingest)
+        ingest_flush.daemon = True
+        ingest_flush.start()
+
+
+# One today-file row per pushed slot, then one shared-state publish. Called with state_lock held.
+def flush_ingest_locked():
+    global ingest_flush
+    if ingest_flush is not None:
+        ingest_flush.cancel()
+        ingest_flush = None
+    slots = sorted(ingest_slots)
+    ingest_slots.clear()
+    if not slots:
+        return
+
+    append_slots_to_file(ingest_today, slots, today_writer)
+    if ingest_today is data_today:
+        publish_shared(today=data_today)
+
+
+def append_slots_to_file(store, slots, writer):
+    with metrics.timer("today_file_append_seconds"):
+        for slot in slots:
+            meter_ids, values = store.slot_readings(slot)
+            readings = {meter_id: float(value) for meter_id, value in zip(meter_ids, values) if not np.isnan(value)}
+            writer.append(store.date, slot_to_timestamp(slot), readings)
+
+
+def flush_ingest():
+    with state_lock:
+        flush_ingest_locked()
+
+
+@app.route("/ingest", methods=["POST"])
+def ingest():
+    if STORE_ROLE == "reader":
+        return jsonify({"message": f"Ingest runs in the ingest process (port {INGEST_PORT})",
+                        "status": "error"}), MISDIRECTED
+
+    started = time.perf_counter()
+    body = request.get_json(silent=True)
+    try:
+        slots = parse_ingest_slots(body)
+        date = int(body["date"]) if body.get("date") else None
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    received = sum(len(meter_ids) for _, meter_ids, _ in slots)
+    # accepted or stale is decided against the ingest day under the lock, so a
+    # rollover cannot land between applying a batch and answering for it
+    with state_lock:
+        ingest_date = ingest_today.date
+        date = date or ingest_date
+        if date > ingest_date:
+            return jsonify({"error": f"{date} has not started yet", "date": ingest_date}), 409
+        stale = date < ingest_date
+        if not stale:
+            for slot, meter_ids, values in slots:
+                today_wal.append(date, slot, meter_ids, values)
+                ingest_today.set_readings(slot, meter_ids, values)
+                ingest_slots.add(slot)
+            schedule_ingest_flush()
+
+    elapsed = time.perf_counter() - started
+    if stale:
+        metrics.inc("ingest_stale_readings_total", received)
+        log_event("ingest_stale", date=date, meters=received)
+        return jsonify({"status": "stale", "accepted": 0, "dropped": received})
+
+    metrics.observe("ingest_batch_seconds", elapsed)
+    metrics.inc("meters_ingested_total", received)
+    metrics.inc("ingest_batches_total")
+    return jsonify({"status": "success", "accepted": received, "slots": len(slots),
+                    "seconds": round(elapsed, 4)})
+
+
+# run one pull tick now instead of waiting for :00 / :30 (INGEST_MODE=pull)
+@app.route("/fetch_now", methods=["POST"])
+def fetch_now():
+    if STORE_ROLE == "reader":
+        return jsonify({"message": f"Ingest runs in the ingest process (port {INGEST_PORT})",
+                        "status": "error"}), MISDIRECTED
+    started = time.perf_counter()
+    fetch_meter_data()
+    return jsonify({"status": "success", "seconds": round(time.perf_counter() - started, 4)})
 
 
 # return whether the server accepts API requests
 @app.route("/api/server_status", methods=["GET"])
 def get_server_status():
-    return jsonify({"acceptAPI": acceptAPI})
+    return jsonify(current_server_status())
+
+
+# Long-poll: ?version=<last seen> returns as soon as the status moves past it,
+# or the unchanged status after ?timeout= seconds
+@app.route("/api/server_status/watch", methods=["GET"])
+def watch_server_status():
+    try:
+        version = int(request.args.get("version", -1))
+        timeout = min(float(request.args.get("timeout", STATUS_WATCH_TIMEOUT)), STATUS_WATCH_TIMEOUT)
+    except ValueError:
+        return jsonify({"error": "version and timeout must be numbers"}), 400
+    with status_changed:
+        status_changed.wait_for(lambda: server_status["version"] != version, timeout=max(0, timeout))
+    return jsonify(current_server_status())
 
 # main ————————————————————————————————————————————————————————————————————————
 
 if __name__ == "__main__":
-    create_test_data()
-    restore_today()    # restore today's data
+    # demo data on the first start only: later starts must keep what the checkpoint / WAL recorded
+    if not os.path.exists(DAILY_HISTORY) and not os.path.exists(TODAY_CHECKPOINT):
+        create_test_data()
+    migrate_today_csv()
     restore_daily()    # restore daily data
-    print(data_today)
-    print(data_daily)
-    start_background_scheduler()
-    app.run(port=5002, debug=True)
+    restore_today()    # restore today's data (opening readings come from daily)
+    recover_rollover() # archive a rollover cut short by a crash
+    restore_baselines()
+    print(f"{len(data_today)} meters today, {len(data_daily)} meters x {data_daily.n_days} days archived")
+    publish_shared(today=data_today, daily=data_daily, baselines=data_baselines)
+    # the reloader would fork a second ingest process with its own scheduler
+    use_reloader = STORE_ROLE != "ingest"
+    # with the reloader this block also runs in the watching parent; only the serving child schedules
+    if not use_reloader or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_scheduler()
+    app.run(port=INGEST_PORT if STORE_ROLE == "ingest" else 5002, debug=True, use_reloader=use_reloader)
@@ -0,0 +1,68 @@
+# v1
+import numpy as np
+from meter_store import TodayStore
+from wal import WriteAheadLog, write_checkpoint, read_checkpoint
+
+# Checkpoint -> restore -> ingest round trips, the way store_readings.restore_today
+# and /ingest use wal.py. Run with: python -m pytest -q test_wal.py
+
+DATE = 20250301
+
+
+def restore(path, store, seq=0):
+    meta, arrays = store.export_state()
+    write_checkpoint(path, meta, arrays, seq)
+    meta, arrays, seq = read_checkpoint(path)
+    return TodayStore.import_state(meta, arrays), seq
+
+
+def test_empty_checkpoint_accepts_readings(tmp_path):
+    restored, seq = restore(str(tmp_path / "today.npz"), TodayStore(DATE))
+    assert seq == 0 and len(restored) == 0
+
+    restored.set_opening(["m1", "m2"], [10.0, 20.0])
+    restored.set_readings(0, ["m1", "m2", "m3"], [11.0, 21.5, 5.0])
+    assert len(restored) == 3
+    assert restored.latest("m2") == (0, 21.5)
+    assert restored.reporting == 3
+    assert restored.daily_total == 2.5   # m3 has no opening reading yet
+
+
+def test_checkpoint_round_trip_then_ingest(tmp_path):
+    store = TodayStore(DATE)
+    store.set_opening(["m1", "m2"], [10.0, 20.0])
+    store.set_readings(0, ["m1", "m2"], [11.0, 22.0])
+    restored, seq = restore(str(tmp_path / "today.npz"), store, seq=7)
+    assert seq == 7
+    assert restored.date == DATE and restored.reporting == 2 and restored.daily_total == 3.0
+
+    # full arrays after restore: the next tick grows them, new meters included
+    restored.set_readings(1, ["m1", "m2"] + [f"n{i}" for i in range(3000)], [12.0, 22.5] + [1.0] * 3000)
+    assert len(restored) == 3002
+    assert restored.latest("m1") == (1, 12.0)
+    assert restored.get_reading("m2", 0) == 22.0
+    assert restored.daily_total == 4.5
+
+
+def test_wal_replays_records_after_checkpoint(tmp_path):
+    path = str(tmp_path / "today.wal")
+    wal = WriteAheadLog(path)
+    store = TodayStore(DATE)
+    for slot, value in ((0, 1.0), (1, 2.0)):
+        wal.append(DATE, slot, ["m1"], [value])
+        store.set_readings(slot, ["m1"], [value])
+    restored, seq = restore(str(tmp_path / "today.npz"), store, seq=wal.seq)
+    wal.rotate()
+    wal.append(DATE, 2, ["m1", "m2"], [3.0, 4.0])
+    wal.close()
+
+    reopened = WriteAheadLog(path)
+    records = reopened.replay(seq)
+    assert [record[2] for record in records] == [2]
+    for _, date, slot, meter_ids, values in records:
+        restored.set_readings(slot, meter_ids, values)
+    assert restored.latest("m1") == (2, 3.0)
+    assert restored.latest("m2") == (2, 4.0)
+    reopened.open(seq)
+    assert reopened.append(DATE, 3, ["m1"], [np.nan]) == 4
+    reopened.close()
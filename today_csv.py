@@ -0,0 +1,53 @@
+# v1
+import io
+import numpy as np
+import pandas as pd
+
+HEADER_PREFIX = "date,timestamp"
+
+
+# Parse an all-numeric, unquoted CSV block into (header, rows x columns float matrix).
+# Very wide files (one column per meter) are slow to parse column by column, so
+# the body is read as one long column instead and reshaped; empty cells are NaN.
+def parse_csv_block(text):
+
+    header, _, body = text.partition("\n")
+    columns = header.strip().split(",")
+    body = body.rstrip("\n")
+    if not body:
+        return columns, np.empty((0, len(columns)))
+
+    values = pd.read_csv(io.StringIO(body.replace(",", "\n")), header=None, names=["value"],
+                         dtype=np.float64, skip_blank_lines=False, engine="c")["value"].to_numpy()
+    if values.size % len(columns) != 0:
+        # ragged rows: fall back to the regular parser
+        df = pd.read_csv(io.StringIO(text), dtype=np.float64)
+        return columns, df.to_numpy()
+    return columns, values.reshape(-1, len(columns))
+
+
+# Read a today CSV written by TodayCsvWriter (one or more header segments)
+def read_today_csv(filename):
+
+    with open(filename, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    segments = []
+    current = []
+    for line in content.splitlines(keepends=True):
+        if line.startswith(HEADER_PREFIX) and current:
+            segments.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        segments.append("".join(current))
+
+    frames = []
+    for segment in segments:
+        columns, matrix = parse_csv_block(segment)
+        df = pd.DataFrame(matrix, columns=columns)
+        df[["date", "timestamp"]] = df[["date", "timestamp"]].astype(np.int64)
+        frames.append(df)
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,199 @@
+# v1
+import os
+import zlib
+import struct
+import numpy as np
+import pandas as pd
+from codec import SCALE, zigzag, unzigzag, varint_encode, varint_decode, bit_widths, pack_bits, unpack_bits, common_divisor
+
+# Compressed, append-only today file (replaces the today CSV).
+#
+# One record per ingested slot, each one row of every meter seen so far:
+#
+#   record  = <payload length u32> <crc32 of payload u32> <kind u8> payload
+#   METERS  payload = new meter ids, "\n"-joined utf-8 (appended to the columns)
+#   ROW     payload = <date u32> <timestamp u16> <columns u32> <divisor u32> <flags u8>
+#                     [present bitmap, only with HAS_MISSING]
+#                     <varint bytes u32> zigzag varints: smallest delta, then the
+#                     first reading of meters that had none yet
+#                     <width u8> delta - smallest delta of the other meters, bit-packed
+#
+# Readings are fixed-point (SCALE units per kWh, divided by the row's common
+# divisor) and each meter's reading is stored as the delta from its previous
+# one, so a half-hour costs a few bits per meter instead of ~8 bytes of text.
+# A torn or corrupt tail left by a crash is cut when the file is reopened.
+
+RECORD_FORMAT = "<IIB"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+ROW_FORMAT = "<IHIIB"
+ROW_SIZE = struct.calcsize(ROW_FORMAT)
+METERS, ROW = 1, 2
+HAS_MISSING = 1
+
+
+class RowCoder:
+    def __init__(self):
+        self.columns = []
+        self.index = {}
+        self.last = np.zeros(0, dtype=np.int64)   # previous reading per column, fixed-point
+        self.seen = np.zeros(0, dtype=bool)
+
+    def add_meters(self, meter_ids):
+        for meter_id in meter_ids:
+            self.index[meter_id] = len(self.columns)
+            self.columns.append(meter_id)
+        self.last = np.concatenate([self.last, np.zeros(len(meter_ids), dtype=np.int64)])
+        self.seen = np.concatenate([self.seen, np.zeros(len(meter_ids), dtype=bool)])
+
+    def encode(self, date, timestamp, values):
+        present = ~np.isnan(values)
+        ints = np.rint(np.where(present, values, 0) * SCALE).astype(np.int64)
+        fresh = present & ~self.seen
+        step = present & self.seen
+        deltas = ints[step] - self.last[step]
+        divisor = common_divisor(np.concatenate([deltas, ints[fresh]]))
+        deltas //= divisor
+        ref = deltas.min() if deltas.size else 0
+        offsets = (deltas - ref).astype(np.uint64)
+        width = int(bit_widths(offsets.max(keepdims=True))[0]) if offsets.size else 0
+
+        flags = 0 if present.all() else HAS_MISSING
+        heads = varint_encode(zigzag(np.concatenate([[ref], ints[fresh] // divisor])))
+        parts = [struct.pack(ROW_FORMAT, int(date), int(timestamp), len(values), divisor, flags)]
+        if flags:
+            parts.append(np.packbits(present, bitorder="little").tobytes())
+        parts += [struct.pack("<I", len(heads)), heads, struct.pack("<B", width)]
+        if width:
+            parts.append(pack_bits(offsets, width))
+
+        self.last[present] = ints[present]
+        self.seen |= present
+        return b"".join(parts)
+
+    # (date, timestamp, readings of every column so far, NaN when missing)
+    def decode(self, payload):
+        date, timestamp, count, divisor, flags = struct.unpack_from(ROW_FORMAT, payload, 0)
+        pos = ROW_SIZE
+        present = np.ones(count, dtype=bool)
+        if flags & HAS_MISSING:
+            n_bytes = (count + 7) // 8
+            present = np.unpackbits(np.frombuffer(payload, dtype=np.uint8, count=n_bytes, offset=pos),
+                                    count=count, bitorder="little").astype(bool)
+            pos += n_bytes
+        fresh = present & ~self.seen[:count]
+        step = present & self.seen[:count]
+        (heads_len,) = struct.unpack_from("<I", payload, pos)
+        pos += 4
+        heads, _ = varint_decode(payload[pos:pos + heads_len], 1 + int(fresh.sum()))
+        heads = unzigzag(heads)
+        pos += heads_len
+        width = payload[pos]
+        pos += 1
+        n_step = int(step.sum())
+        offsets = unpack_bits(payload[pos:], (n_step,), width).astype(np.int64) if width else np.zeros(n_step, np.int64)
+
+        ints = self.last[:count].copy()
+        ints[step] += (offsets + heads[0]) * divisor
+        ints[fresh] = heads[1:] * divisor
+        self.last[:count] = np.where(present, ints, self.last[:count])
+        self.seen[:count] |= present
+        return date, timestamp, np.where(present, ints / SCALE, np.nan)
+
+
+def encode_record(kind, payload):
+    return struct.pack(RECORD_FORMAT, len(payload), zlib.crc32(payload), kind) + payload
+
+
+# (kind, payload) for each whole record, and the byte length of the valid part
+def scan(content):
+    records = []
+    offset = 0
+    while offset + RECORD_SIZE <= len(content):
+        length, crc, kind = struct.unpack_from(RECORD_FORMAT, content, offset)
+        payload = content[offset + RECORD_SIZE:offset + RECORD_SIZE + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        records.append((kind, payload))
+        offset += RECORD_SIZE + length
+    return records, offset
+
+
+# Appends one record per slot, fsynced; columns grow as new meters report
+class TodayFileWriter:
+    def __init__(self, filename):
+        self.filename = filename
+        self.coder = RowCoder()
+        self.file = None
+
+    # Pick up the columns and each meter's last reading; cut a torn tail
+    def open(self):
+        if self.file is not None:
+            return
+        content = b""
+        if os.path.exists(self.filename):
+            with open(self.filename, "rb") as f:
+                content = f.read()
+        records, valid = scan(content)
+        self.coder = RowCoder()
+        for kind, payload in records:
+            if kind == METERS:
+                self.coder.add_meters(payload.decode("utf-8").split("\n"))
+            else:
+                self.coder.decode(payload)
+        self.file = open(self.filename, "ab")
+        self.file.truncate(valid)
+
+    def append(self, date, timestamp, readings):
+        self.open()
+        new_meters = [meter_id for meter_id in readings if meter_id not in self.coder.index]
+        data = b""
+        if new_meters:
+            self.coder.add_meters(new_meters)
+            data = encode_record(METERS, "\n".join(new_meters).encode("utf-8"))
+
+        values = np.full(len(self.coder.columns), np.nan)
+        rows = np.fromiter((self.coder.index[meter_id] for meter_id in readings), dtype=np.int64, count=len(readings))
+        values[rows] = np.fromiter(readings.values(), dtype=np.float64, count=len(readings))
+        data += encode_record(ROW, self.coder.encode(date, timestamp, values))
+
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    # Start an empty file, e.g. at daily rollover
+    def reset(self):
+        self.close()
+        open(self.filename, "wb").close()
+        self.coder = RowCoder()
+        self.file = open(self.filename, "ab")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# Read a today file into the same frame as today_csv.read_today_csv:
+# date, timestamp, then one column per meter
+def read_today_file(filename):
+    with open(filename, "rb") as f:
+        records, _ = scan(f.read())
+
+    coder = RowCoder()
+    dates, timestamps, rows = [], [], []
+    for kind, payload in records:
+        if kind == METERS:
+            coder.add_meters(payload.decode("utf-8").split("\n"))
+        else:
+            date, timestamp, values = coder.decode(payload)
+            dates.append(date)
+            timestamps.append(timestamp)
+            rows.append(values)
+
+    matrix = np.full((len(rows), len(coder.columns)), np.nan)
+    for i, values in enumerate(rows):
+        matrix[i, :len(values)] = values
+    df = pd.DataFrame(matrix, columns=coder.columns)
+    df.insert(0, "timestamp", np.array(timestamps, dtype=np.int64))
+    df.insert(0, "date", np.array(dates, dtype=np.int64))
+    return df
@@ -1,14 +1,48 @@
-# v2
+# v3
 import json
 import os
+import sqlite3
+import threading
+
+# Users live in SQLite (WAL mode) with indexed lookups by username and meter_id.
+# Meter IDs come from an atomic sequence, so signup cost does not grow with the
+# number of users and concurrent signups cannot lose writes.
 
 class UserManager:
-    USER_DATA_FILE = "users.json"
-    
-    def __init__(self):
-        self.users = self.load_users()
+    USER_DATA_FILE = "users.json"      # legacy store, migrated on first start
+    USER_DB_FILE = "users.db"
+    FIRST_METER_ID = 100000001
+
+    def __init__(self, db_file=None):
+        self.db_file = db_file or self.USER_DB_FILE
+        self.local = threading.local()
+        self.create_tables()
+        self.migrate_from_json()
         print("loading users...")
-    
+
+    # one connection per thread; autocommit, transactions are explicit
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, isolation_level=None, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def create_tables(self):
+        conn = self.connection()
+        # username is the primary key and meter_id is UNIQUE: both are indexed
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                username TEXT PRIMARY KEY,
+                password TEXT NOT NULL,
+                meter_id TEXT NOT NULL UNIQUE
+            )""")
+        conn.execute("CREATE TABLE IF NOT EXISTS sequences (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES ('meter_id', ?)",
+                     (self.FIRST_METER_ID - 1,))
+
     def load_users(self):
         if os.path.exists(self.USER_DATA_FILE):
             with open(self.USER_DATA_FILE, "r") as f:
@@ -17,28 +51,48 @@ class UserManager:
                 except json.JSONDecodeError:
                     return {}
         return {}
-    
-    def save_users(self):
-        with open(self.USER_DATA_FILE, "w") as f:
-            json.dump(self.users, f, indent=4)
-    
-    def generate_meter_id(self):
-        last_id = 100000001
-        if self.users:
-            existing_ids = [int(user["meter_id"]) for user in self.users.values()]
-            last_id = max(existing_ids) + 1 if existing_ids else last_id
-        return str(last_id)
-    
+
+    # One-off import of users.json into an empty database
+    def migrate_from_json(self):
+        conn = self.connection()
+        if conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+            return
+        users = self.load_users()
+        if not users:
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("INSERT OR IGNORE INTO users (username, password, meter_id) VALUES (?, ?, ?)",
+                         [(username, data["password"], str(data["meter_id"])) for username, data in users.items()])
+        last_id = max(int(data["meter_id"]) for data in users.values())
+        conn.execute("UPDATE sequences SET value = MAX(value, ?) WHERE name = 'meter_id'", (last_id,))
+        conn.execute("COMMIT")
+        print(f"Migrated {len(users)} users from {self.USER_DATA_FILE} to {self.db_file}")
+
     def add_user(self, username, password):
-        if username in self.users:
-            return False
-        meter_id = self.generate_meter_id()
-        self.users[username] = {"password": password, "meter_id": meter_id}
-        self.save_users()
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone():
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("UPDATE sequences SET value = value + 1 WHERE name = 'meter_id'")
+            meter_id = str(conn.execute("SELECT value FROM sequences WHERE name = 'meter_id'").fetchone()[0])
+            conn.execute("INSERT INTO users (username, password, meter_id) VALUES (?, ?, ?)",
+                         (username, password, meter_id))
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
         return True
-    
+
     def validate_user(self, username, password):
-        return username in self.users and self.users[username]["password"] == password
-    
+        row = self.connection().execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None and row[0] == password
+
     def get_meter_id(self, username):
-        return self.users.get(username, {}).get("meter_id", "N/A")
+        row = self.connection().execute("SELECT meter_id FROM users WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else "N/A"
+
+    def get_meter_ids(self):
+        return [row[0] for row in self.connection().execute("SELECT meter_id FROM users ORDER BY meter_id")]
@@ -0,0 +1,140 @@
+# v1
+import os
+import json
+import zlib
+import struct
+import numpy as np
+
+# Write-ahead log and checkpoints for the today store in store_readings.py.
+#
+# Every ingested batch (one slot, many meters) is appended to the log and
+# fsynced before it is applied in memory. Each record carries a sequence number:
+#
+#   record  = header + payload
+#   header  = <payload length u32> <crc32 of payload u32> <seq u64>
+#   payload = <date u32> <slot u16> <count u32> <count float64 readings> <meter ids, "\n"-joined utf-8>
+#
+# A checkpoint is the whole today store in one .npz file plus the sequence
+# number it includes. Taking one rotates the log to <filename>.prev, which is
+# dropped once the checkpoint is on disk, so recovery loads the checkpoint and
+# replays only the records written after it.
+
+HEADER_FORMAT = "<IIQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+PAYLOAD_FORMAT = "<IHI"
+PAYLOAD_SIZE = struct.calcsize(PAYLOAD_FORMAT)
+
+
+def encode_record(seq, date, slot, meter_ids, values):
+    values = np.asarray(values, dtype="<f8")
+    payload = (struct.pack(PAYLOAD_FORMAT, int(date), int(slot), len(values)) + values.tobytes()
+               + "\n".join(str(meter_id) for meter_id in meter_ids).encode("utf-8"))
+    return struct.pack(HEADER_FORMAT, len(payload), zlib.crc32(payload), seq) + payload
+
+
+def decode_payload(payload):
+    date, slot, count = struct.unpack_from(PAYLOAD_FORMAT, payload, 0)
+    values_end = PAYLOAD_SIZE + count * 8
+    values = np.frombuffer(payload, dtype="<f8", count=count, offset=PAYLOAD_SIZE)
+    meter_ids = payload[values_end:].decode("utf-8").split("\n") if count else []
+    return date, slot, meter_ids, values
+
+
+# (seq, date, slot, meter_ids, values) for each whole record, and the byte length
+# of the valid part: a torn or corrupt tail left by a crash ends the scan
+def scan(filename):
+    records = []
+    try:
+        with open(filename, "rb") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return records, 0
+    offset = 0
+    while offset + HEADER_SIZE <= len(content):
+        length, crc, seq = struct.unpack_from(HEADER_FORMAT, content, offset)
+        payload = content[offset + HEADER_SIZE:offset + HEADER_SIZE + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        records.append((seq, *decode_payload(payload)))
+        offset += HEADER_SIZE + length
+    return records, offset
+
+
+class WriteAheadLog:
+    def __init__(self, filename):
+        self.filename = filename
+        self.prev_filename = filename + ".prev"
+        self.file = None
+        self.seq = 0
+
+    # Records after seq, oldest first, from the rotated log and the current one
+    def replay(self, after_seq=0):
+        records, _ = scan(self.prev_filename)
+        current, _ = scan(self.filename)
+        return [record for record in records + current if record[0] > after_seq]
+
+    # Cut a torn tail and continue numbering after everything seen so far
+    def open(self, min_seq=0):
+        if self.file is not None:
+            return
+        records, valid = scan(self.filename)
+        prev_records, _ = scan(self.prev_filename)
+        self.seq = max([min_seq] + [record[0] for record in prev_records + records])
+        self.file = open(self.filename, "ab")
+        self.file.truncate(valid)
+
+    def append(self, date, slot, meter_ids, values):
+        self.open()
+        self.seq += 1
+        self.file.write(encode_record(self.seq, date, slot, meter_ids, values))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.seq
+
+    def size(self):
+        return self.file.tell() if self.file is not None else 0
+
+    # Start a fresh log; the records so far wait in .prev until their checkpoint is written.
+    # A .prev left by a failed checkpoint is kept and extended, never replaced.
+    def rotate(self):
+        self.open()
+        self.file.close()
+        self.file = None
+        if os.path.exists(self.prev_filename):
+            with open(self.filename, "rb") as src, open(self.prev_filename, "ab") as dst:
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            open(self.filename, "wb").close()
+        else:
+            os.replace(self.filename, self.prev_filename)
+        self.file = open(self.filename, "ab")
+
+    def drop_rotated(self):
+        if os.path.exists(self.prev_filename):
+            os.remove(self.prev_filename)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def write_checkpoint(filename, meta, arrays, seq):
+    tmp_path = filename + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, meta=np.array(json.dumps({**meta, "seq": seq}, default=float)), **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, filename)
+    return os.path.getsize(filename)
+
+
+# (meta, arrays, seq), or None when there is no checkpoint yet
+def read_checkpoint(filename):
+    if not os.path.exists(filename):
+        return None
+    with np.load(filename) as data:
+        meta = json.loads(str(data["meta"]))
+        arrays = {name: data[name] for name in data.files if name != "meta"}
+    return meta, arrays, meta.pop("seq")